@@ -1,13 +1,25 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from typing import List, Tuple
 import os.path
 from pathlib import Path
 import textwrap
+import warnings
+import zlib
 
+import netCDF4
 import numpy as np
 import xarray as xr
 
-from gridspec.misc.geometry import spherical_excess_area
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+from gridspec.misc.encoding import EncodingPolicy, chunk_shape, zarr_v3
+from gridspec.misc.geometry import great_circle_midpoint, latlon_cell_area, quadrilateral_area, quadrilateral_workspace, \
+    spherical_excess_area
 
 
 def string_da(value, **attrs):
@@ -24,6 +36,11 @@ def string_array_da(values, dim, **attrs):
     return da
 
 
+def decode_string(value) -> str:
+    """ Returns the str of a character array's value (NetCDF files have bytes, Zarr stores have str) """
+    return value.decode() if isinstance(value, bytes) else value
+
+
 def get_da_name(ds, standard_name, only_one=True):
     name = list(ds.filter_by_attrs(standard_name=standard_name).variables)
     if not only_one:
@@ -42,17 +59,118 @@ def first_da_matching_standard_name(ds, standard_name, only_one=True):
         return v[0]
 
 
+def grid_checksum(*arrays) -> str:
+    """ Returns a checksum (the CRC-32s, in hex) of the float64 values of the arrays. It is stored with cell areas
+    so that they can be checked against the grid they were computed for.
+    """
+    return "".join(f"{zlib.crc32(np.ascontiguousarray(a, dtype='<f8')):08x}" for a in arrays)
+
+
+def _area_workers_from_env() -> int:
+    """ Returns the default number of threads that compute cell areas: GRIDSPEC_AREA_WORKERS, or the number of CPUs """
+    cpu_count = os.cpu_count() or 1
+    value = os.environ.get('GRIDSPEC_AREA_WORKERS')
+    if value is None:
+        return cpu_count
+    try:
+        workers = int(value)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        warnings.warn(f"Invalid GRIDSPEC_AREA_WORKERS: {value!r} (expected an integer >= 1); using {cpu_count}")
+        return cpu_count
+    return workers
+
+
+# the number of cells whose areas are computed at a time, and the default number of threads that compute them
+AREA_BLOCK_SIZE = 2**16
+AREA_WORKERS = _area_workers_from_env()
+
+
 def cwd_if_no_output_dir(directory) -> Path:
     if directory is None:
         return Path.cwd()
     return Path(directory)
 
 
+def _require_zarr():
+    if zarr is None:
+        raise ImportError("Zarr stores require zarr (pip install gridspec[zarr])")
+
+
+def is_zarr_store(path) -> bool:
+    """ Returns True if path is a Zarr (directory) store """
+    path = Path(path)
+    return path.is_dir() and any(path.joinpath(name).exists() for name in ['zarr.json', '.zgroup', '.zattrs'])
+
+
+def open_zarr_dataset(store, group=None, lazy=False) -> xr.Dataset:
+    """ Opens a group of a Zarr store (without dask). If lazy is True, values are read only when they are accessed. """
+    _require_zarr()
+    return xr.open_dataset(store, engine='zarr', group=group, chunks=None, consolidated=False, cache=not lazy)
+
+
+def write_zarr_dataset(ds, store, group=None, encoding=None, area=()):
+    """ Writes ds to a group of a Zarr store (replacing the group), encoded with encoding (an EncodingPolicy).
+
+    The store's metadata is not consolidated, so groups can be written independently (e.g. each tile of a mosaic by
+    a different process). Character arrays are stored as variable-length strings, which both Zarr formats support.
+    """
+    _require_zarr()
+    if encoding is None:
+        encoding = EncodingPolicy()
+    ds = ds.copy()
+    for name, var in ds.variables.items():
+        if var.dtype.kind == 'S':
+            ds[name] = var.copy(data=np.char.decode(var.values).astype(object))
+    ds.to_zarr(store, group=group, mode='w', consolidated=False, encoding=encoding.zarr_encoding(ds, area=area))
+
+
+def _create_zarr_array(zarr_group, name, dims, attrs, **kwargs):
+    """ Creates an array in a Zarr group, with its dimension names where xarray reads them for the zarr version """
+    if zarr_v3():
+        return zarr_group.create_array(name, dimension_names=dims, attributes=attrs, **kwargs)
+    array = zarr_group.create_dataset(name, **kwargs)
+    array.attrs.update(attrs, _ARRAY_DIMENSIONS=dims)
+    return array
+
+
+class LazyArray:
+    """ A read-only array backed by a lazily loaded xr.DataArray.
+
+    Indexing reads only the selected values from disk. Converting it to a np.ndarray (np.asarray) reads everything.
+    """
+    def __init__(self, da):
+        self._da = da
+
+    @property
+    def shape(self):
+        return self._da.shape
+
+    @property
+    def ndim(self):
+        return self._da.ndim
+
+    @property
+    def dtype(self):
+        return self._da.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return self._da[key].values[()]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self._da.values, dtype=dtype)
+
+
 class LogicallyRectangularGrid:
     def __init__(self, supergrid_lats=None, supergrid_lons=None):
         self.supergrid_lats = supergrid_lats
         self.supergrid_lons = supergrid_lons
         self.area = None
+        self._stored_area = None
 
     @property
     def supergrid_lats(self) -> np.ndarray:
@@ -72,6 +190,8 @@ class LogicallyRectangularGrid:
 
     @property
     def area(self) -> np.ndarray:
+        if self._area is None:
+            self.area = self._read_stored_area()
         if self._area is None:
             self.area = self._calc_area()
         return self._area
@@ -80,27 +200,84 @@ class LogicallyRectangularGrid:
     def area(self, areas):
         self._area = areas
 
-    def _calc_area(self) -> np.ndarray:
-        upper = slice(0, -2, 2)
-        lower = slice(2, None, 2)
+    def grid_checksum(self) -> str:
+        return grid_checksum(self.supergrid_lats, self.supergrid_lons)
+
+    def supergrids_2d(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the supergrid latitudes and longitudes as 2D arrays. The 1D supergrids of regular grids are
+        broadcast (read-only views, nothing is copied).
+        """
+        if len(self.supergrid_lats.shape) != 1:
+            return self.supergrid_lats, self.supergrid_lons
+        shape = (self.supergrid_lats.shape[0], self.supergrid_lons.shape[0])
+        supergrid_lats = np.broadcast_to(np.asarray(self.supergrid_lats)[:, np.newaxis], shape)
+        supergrid_lons = np.broadcast_to(np.asarray(self.supergrid_lons)[np.newaxis, :], shape)
+        return supergrid_lats, supergrid_lons
+
+    def set_stored_area(self, da):
+        """ Sets a (lazily loaded) cell area xr.DataArray that was read from a file. It is used for area if its
+        grid_checksum attribute matches the grid. Otherwise the area is recomputed.
+        """
+        self.area = None
+        self._stored_area = da
+
+    def _read_stored_area(self):
+        da, self._stored_area = self._stored_area, None
+        if da is None or da.attrs.get('grid_checksum') != self.grid_checksum():
+            return None
+        # areas may be stored as float32 (see EncodingPolicy)
+        return np.asarray(da.values, dtype=np.float64)
+
+    def _calc_area(self, block_size=None, workers=None) -> np.ndarray:
+        """ Computes the cell areas in blocks of about block_size cells (default: AREA_BLOCK_SIZE).
+
+        With workers > 1 (default: AREA_WORKERS), the blocks are split between that many threads. Each thread reuses
+        its own workspace, so the memory for temporaries is bounded by workers * block_size.
+
+        Regular grids (1D supergrids) use the closed-form area of lat-lon cells instead.
+        """
+        if len(self.supergrid_lats.shape) == 1:
+            lat_edges = np.asarray(self.supergrid_lats)[0::2]
+            lon_edges = np.asarray(self.supergrid_lons)[0::2]
+            return latlon_cell_area(
+                np.transpose([lat_edges[:-1], lat_edges[1:]]), np.transpose([lon_edges[:-1], lon_edges[1:]])
+            )
+        if block_size is None:
+            block_size = AREA_BLOCK_SIZE
+        if workers is None:
+            workers = AREA_WORKERS
+        supergrid_lats = np.asarray(self.supergrid_lats)
+        supergrid_lons = np.asarray(self.supergrid_lons)
+        nrows = (supergrid_lats.shape[0] - 1) // 2
+        ncols = (supergrid_lats.shape[1] - 1) // 2
+        area = np.empty((nrows, ncols))
+        block_rows = max(1, min(nrows, block_size // max(ncols, 1)))
+        starts = list(range(0, nrows, block_rows))
         left = slice(0, -2, 2)
         right = slice(2, None, 2)
-        phi1 = self.supergrid_lats[upper, left]
-        phi2 = self.supergrid_lats[lower, left]
-        phi3 = self.supergrid_lats[lower, right]
-        phi4 = self.supergrid_lats[upper, right]
-
-        lam1 = self.supergrid_lons[upper, left]
-        lam2 = self.supergrid_lons[lower, left]
-        lam3 = self.supergrid_lons[lower, right]
-        lam4 = self.supergrid_lons[upper, right]
-
-        pt1 = np.moveaxis(np.array((phi1, lam1)), 0, -1)
-        pt2 = np.moveaxis(np.array((phi2, lam2)), 0, -1)
-        pt3 = np.moveaxis(np.array((phi3, lam3)), 0, -1)
-        pt4 = np.moveaxis(np.array((phi4, lam4)), 0, -1)
-
-        area = spherical_excess_area(np.deg2rad(pt1), np.deg2rad(pt2), np.deg2rad(pt3), np.deg2rad(pt4))
+
+        def calc_blocks(starts):
+            workspace = quadrilateral_workspace((block_rows, ncols))
+            for start in starts:
+                stop = min(start + block_rows, nrows)
+                upper = slice(2 * start, 2 * stop - 1, 2)
+                lower = slice(2 * start + 2, 2 * stop + 1, 2)
+                pt1 = (supergrid_lats[upper, left], supergrid_lons[upper, left])
+                pt2 = (supergrid_lats[lower, left], supergrid_lons[lower, left])
+                pt3 = (supergrid_lats[lower, right], supergrid_lons[lower, right])
+                pt4 = (supergrid_lats[upper, right], supergrid_lons[upper, right])
+                quadrilateral_area(
+                    pt1, pt2, pt3, pt4, degrees=True, out=area[start:stop], workspace=workspace[:, :stop - start]
+                )
+
+        workers = min(workers, len(starts))
+        if workers <= 1:
+            calc_blocks(starts)
+        else:
+            # NumPy releases the GIL in the ufuncs, so the threads run in parallel
+            with ThreadPoolExecutor(workers) as executor:
+                for future in [executor.submit(calc_blocks, starts[i::workers]) for i in range(workers)]:
+                    future.result()
         return area
 
 
@@ -145,34 +322,177 @@ class GridspecTile(LogicallyRectangularGrid):
         )
         ds[self.name_area] = xr.DataArray(
             self.area, dims=[self.name_area_dim1, self.name_area_dim2],
-            attrs=dict(standard_name="cell_area", units="m2")
+            attrs=dict(standard_name="cell_area", units="m2", grid_checksum=self.grid_checksum())
         )
         return ds
 
-    def load(self, ds) -> bool:
+    def load(self, ds, lazy=False) -> bool:
+        """ Loads the tile from ds. If lazy is True, the supergrids are LazyArrays so only the values that are
+        accessed are read.
+        """
         if len(get_da_name(ds, standard_name="grid_tile_spec", only_one=False)) != 1:
             return False
         self.name_dummy = get_da_name(ds, standard_name="grid_tile_spec")
-        self.name = ds[self.name_dummy].item().decode()
+        self.name = decode_string(ds[self.name_dummy].item())
         self.attrs = ds[self.name_dummy].attrs
         self.name_lats = get_da_name(ds, standard_name="geographic_latitude")
-        self.supergrid_lats = ds[self.name_lats].values
         self.name_lons = get_da_name(ds, standard_name="geographic_longitude")
-        self.supergrid_lons = ds[self.name_lons].values
+        if lazy:
+            self.supergrid_lats = LazyArray(ds[self.name_lats])
+            self.supergrid_lons = LazyArray(ds[self.name_lons])
+        else:
+            self.supergrid_lats = ds[self.name_lats].values
+            self.supergrid_lons = ds[self.name_lons].values
         if self.is_regular():
             self.name_dim1 = ds[self.name_lats].dims[0]
             self.name_dim2 = ds[self.name_lons].dims[0]
         else:
             self.name_dim1 = ds[self.name_lons].dims[0]
             self.name_dim2 = ds[self.name_lons].dims[1]
+        area_names = get_da_name(ds, standard_name="cell_area", only_one=False)
+        if len(area_names) == 1:
+            self.name_area = area_names[0]
+            self.name_area_dim1, self.name_area_dim2 = ds[self.name_area].dims
+            self.set_stored_area(ds[self.name_area])
         return True
 
-    def open_netcdf(self, filepath) -> bool:
-        ds = xr.open_dataset(filepath)
-        return self.load(ds)
+    def open_netcdf(self, filepath, lazy=False) -> bool:
+        ds = xr.open_dataset(filepath, cache=not lazy)
+        return self.load(ds, lazy=lazy)
+
+    def to_netcdf(self, filepath, encoding=None):
+        """ Writes the tile to filepath, with the compression, chunking and precision of encoding (an
+        EncodingPolicy; default: uncompressed float64).
+        """
+        self._write_dataset(self.dump(), filepath, encoding)
+
+    def _write_dataset(self, ds, filepath, encoding=None):
+        if encoding is None:
+            encoding = EncodingPolicy()
+        ds.to_netcdf(filepath, encoding=encoding.encoding(ds, area=[self.name_area]))
+
+    def open_zarr(self, store, group=None, lazy=False) -> bool:
+        return self.load(open_zarr_dataset(store, group=group, lazy=lazy), lazy=lazy)
+
+    def to_zarr(self, store, group=None, encoding=None):
+        """ Writes the tile to a group of a Zarr store (see write_zarr_dataset) """
+        write_zarr_dataset(self.dump(), store, group=group, encoding=encoding, area=[self.name_area])
+        return str(store)
+
+    def to_zarr_streaming(self, store, shape, supergrid_rows, group=None, block_rows=None, workers=None,
+                          encoding=None):
+        """ Writes a curvilinear tile to a group of a Zarr store without holding its supergrids in memory (see
+        to_netcdf_streaming).
+
+        The arrays are chunked by blocks of block_rows cells (by default, sized by encoding's chunk_bytes), so each
+        chunk is written by one block. With workers > 1, the blocks are computed and written concurrently by worker
+        processes.
+        """
+        _require_zarr()
+        if encoding is None:
+            encoding = EncodingPolicy()
+        nrows, ncols = shape
+        ncell_rows = (nrows - 1) // 2
+        area_shape = (ncell_rows, (ncols - 1) // 2)
+        if block_rows is None:
+            block_rows = max(1, chunk_shape(shape, 8, encoding.chunk_bytes)[0] // 2)
+        block_rows = min(block_rows, max(ncell_rows, 1))
+
+        ds = xr.Dataset()
+        ds[self.name_dummy] = string_da(self.name, **self.attrs)
+        write_zarr_dataset(ds, store, group=group, encoding=encoding)
+        zarr_group = zarr.open_group(store, path=group or '', mode='a')
+        supergrid_kwargs = dict(encoding.zarr_array_kwargs(shape, 'f8'), chunks=(2 * block_rows, ncols))
+        for name, standard_name, units in [
+            (self.name_lons, "geographic_longitude", "degree_east"),
+            (self.name_lats, "geographic_latitude", "degree_north"),
+        ]:
+            _create_zarr_array(
+                zarr_group, name, [self.name_dim1, self.name_dim2], dict(standard_name=standard_name, units=units),
+                shape=shape, dtype='f8', fill_value=np.nan, **supergrid_kwargs
+            )
+        area_dtype = encoding.area_dtype()
+        area_kwargs = dict(encoding.zarr_array_kwargs(area_shape, area_dtype), chunks=(block_rows, area_shape[1]))
+        area = _create_zarr_array(
+            zarr_group, self.name_area, [self.name_area_dim1, self.name_area_dim2],
+            dict(standard_name="cell_area", units="m2"), shape=area_shape, dtype=area_dtype, fill_value=np.nan,
+            **area_kwargs
+        )
 
-    def to_netcdf(self, filepath):
-        self.dump().to_netcdf(filepath)
+        arrays = [zarr_group[name].path for name in [self.name_lats, self.name_lons, self.name_area]]
+        starts = range(0, ncell_rows, block_rows)
+        write_block = partial(
+            _write_zarr_block, str(store), arrays, supergrid_rows, ncell_rows=ncell_rows, block_rows=block_rows
+        )
+        if workers is None or workers <= 1:
+            for start in starts:
+                write_block(start)
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                list(executor.map(write_block, starts))
+
+        # the checksum is of the whole supergrids, in order, so it's computed once the blocks are written
+        lats, lons = zarr_group[self.name_lats], zarr_group[self.name_lons]
+        crc_lats = crc_lons = 0
+        for start in range(0, nrows, 2 * block_rows):
+            rows = slice(start, start + 2 * block_rows)
+            crc_lats = zlib.crc32(np.ascontiguousarray(lats[rows], dtype='<f8'), crc_lats)
+            crc_lons = zlib.crc32(np.ascontiguousarray(lons[rows], dtype='<f8'), crc_lons)
+        area.attrs['grid_checksum'] = f"{crc_lats:08x}{crc_lons:08x}"
+        return str(store)
+
+    def to_netcdf_streaming(self, filepath, shape, supergrid_rows, block_rows=None, encoding=None):
+        """ Writes a curvilinear tile without holding its supergrids in memory.
+
+        shape is the (odd) supergrid shape, and supergrid_rows(start, stop) returns the (lats, lons) of supergrid rows
+        start:stop. Rows are requested in blocks of block_rows cells (2*block_rows+1 supergrid rows, with the boundary
+        row shared by consecutive blocks). By default the whole tile is one block. encoding is an EncodingPolicy.
+        """
+        if encoding is None:
+            encoding = EncodingPolicy()
+        ds = xr.Dataset()
+        ds[self.name_dummy] = string_da(self.name, **self.attrs)
+        ds.to_netcdf(filepath)
+
+        nrows, ncols = shape
+        ncell_rows = (nrows - 1) // 2
+        area_shape = (ncell_rows, (ncols - 1) // 2)
+        if block_rows is None:
+            block_rows = ncell_rows
+        with netCDF4.Dataset(filepath, 'a') as nc:
+            nc.createDimension(self.name_dim1, nrows)
+            nc.createDimension(self.name_dim2, ncols)
+            nc.createDimension(self.name_area_dim1, ncell_rows)
+            nc.createDimension(self.name_area_dim2, area_shape[1])
+            supergrid_kwargs = encoding.variable_kwargs(shape, 'f8')
+            lons = nc.createVariable(
+                self.name_lons, 'f8', (self.name_dim1, self.name_dim2), fill_value=np.nan, **supergrid_kwargs
+            )
+            lons.setncatts(dict(standard_name="geographic_longitude", units="degree_east"))
+            lats = nc.createVariable(
+                self.name_lats, 'f8', (self.name_dim1, self.name_dim2), fill_value=np.nan, **supergrid_kwargs
+            )
+            lats.setncatts(dict(standard_name="geographic_latitude", units="degree_north"))
+            area_dtype = encoding.area_dtype()
+            area = nc.createVariable(
+                self.name_area, area_dtype, (self.name_area_dim1, self.name_area_dim2),
+                fill_value=area_dtype.type(np.nan), **encoding.variable_kwargs(area_shape, area_dtype)
+            )
+            area.setncatts(dict(standard_name="cell_area", units="m2"))
+
+            crc_lats = crc_lons = 0
+            for start in range(0, ncell_rows, block_rows):
+                stop = min(start + block_rows, ncell_rows)
+                block_lats, block_lons = supergrid_rows(2 * start, 2 * stop + 1)
+                lats[2 * start:2 * stop + 1, :] = block_lats
+                lons[2 * start:2 * stop + 1, :] = block_lons
+                area[start:stop, :] = LogicallyRectangularGrid(block_lats, block_lons).area
+                # the first row of a block is the last row of the previous one
+                new_rows = slice(0 if start == 0 else 1, None)
+                crc_lats = zlib.crc32(np.ascontiguousarray(block_lats[new_rows], dtype='<f8'), crc_lats)
+                crc_lons = zlib.crc32(np.ascontiguousarray(block_lons[new_rows], dtype='<f8'), crc_lons)
+            area.setncattr('grid_checksum', f"{crc_lats:08x}{crc_lons:08x}")
+        return filepath
 
     def __eq__(self, other):
         names_are_equal = (
@@ -268,6 +588,7 @@ class GridspecMosaic:
         self.contacts = contacts
         self.contact_indices = contact_indices
         self.this_files_path = None
+        self.consolidated = False
 
     def tile_paths(self, mosaic_dir=None):
         paths = []
@@ -320,45 +641,213 @@ class GridspecMosaic:
         )
         return ds
 
-    def to_netcdf(self, directory=None, write_tiles=True):
+    def to_netcdf(self, directory=None, write_tiles=True, workers=None, processes=False, encoding=None):
+        """ Writes the mosaic file (and the tile files) to directory. The tile files are encoded with encoding (an
+        EncodingPolicy).
+
+        With workers > 1, tiles are handled concurrently. By default a thread pool computes the tiles' datasets (cell
+        areas) while finished ones are written, one at a time, from this thread. If processes is True, each tile is
+        computed and written by a worker process instead.
+        """
         directory = cwd_if_no_output_dir(directory)
         ds = self.dump()
         opath = str(directory.joinpath(f'{self.name}.nc'))
         ds.to_netcdf(opath)
 
         if write_tiles:
-            tile_paths = []
-            for tile_path, tile in zip(self.tile_paths(mosaic_dir=directory), self.tiles):
-                tile.to_netcdf(tile_path)
-                tile_paths.append(tile_path)
+            tile_paths = self.tile_paths(mosaic_dir=directory)
+            if workers is None or workers <= 1:
+                for tile_path, tile in zip(tile_paths, self.tiles):
+                    tile.to_netcdf(tile_path, encoding=encoding)
+            elif processes:
+                with ProcessPoolExecutor(workers) as executor:
+                    list(executor.map(partial(_write_tile, encoding=encoding), self.tiles, tile_paths))
+            else:
+                # NetCDF/HDF5 writes are not thread-safe, so only the datasets are computed concurrently
+                with ThreadPoolExecutor(workers) as executor:
+                    tile_datasets = executor.map(lambda tile: tile.dump(), self.tiles)
+                    for tile_path, tile, tile_ds in zip(tile_paths, self.tiles, tile_datasets):
+                        tile._write_dataset(tile_ds, tile_path, encoding)
             return opath, tile_paths
         else:
             return opath
 
+    def to_netcdf_consolidated(self, directory=None, filename=None, encoding=None):
+        """ Writes the mosaic and its tiles to a single file (the consolidated layout): {name}.nc in directory, unless
+        filename is given. Returns its path.
+
+        The tiles' supergrids and cell areas are stacked along the ntiles dimension (so the tiles must have the same
+        shape), and each tile's attributes are on a variable named after the tile. The area's grid_checksum attribute
+        has the tiles' checksums, separated by spaces. The tiles are written one at a time, so only one tile's
+        supergrids are in memory if the tiles are loaded lazily.
+        """
+        if encoding is None:
+            encoding = EncodingPolicy()
+        opath = str(cwd_if_no_output_dir(directory).joinpath(f'{self.name}.nc' if filename is None else filename))
+        ds = self.dump()
+        ds[self.name_dummy].attrs['tile_layout'] = 'consolidated'
+        for tile_name, tile in zip(self.tile_names, self.tiles):
+            ds[tile_name] = string_da(tile.name, **tile.attrs)
+        ds.to_netcdf(opath)
+
+        checksums = []
+        with netCDF4.Dataset(opath, 'a') as nc:
+            for i, tile in enumerate(self._tiles_with_supergrids()):
+                supergrid_lats = np.asarray(tile.supergrid_lats)
+                supergrid_lons = np.asarray(tile.supergrid_lons)
+                if i == 0:
+                    first = tile
+                    if tile.is_regular():
+                        lats_dims, lons_dims = [tile.name_lats], [tile.name_lons]
+                    else:
+                        lats_dims = lons_dims = [tile.name_dim1, tile.name_dim2]
+                    dims = {
+                        **dict(zip(lats_dims, supergrid_lats.shape)), **dict(zip(lons_dims, supergrid_lons.shape)),
+                        tile.name_area_dim1: (supergrid_lats.shape[0] - 1) // 2,
+                        tile.name_area_dim2: (supergrid_lons.shape[-1] - 1) // 2,
+                    }
+                    for dim, size in dims.items():
+                        nc.createDimension(dim, size)
+                    variables = []
+                    for name, var_dims, dtype, attrs in [
+                        (tile.name_lons, lons_dims, np.dtype('f8'),
+                         dict(standard_name="geographic_longitude", units="degree_east")),
+                        (tile.name_lats, lats_dims, np.dtype('f8'),
+                         dict(standard_name="geographic_latitude", units="degree_north")),
+                        (tile.name_area, [tile.name_area_dim1, tile.name_area_dim2], encoding.area_dtype(),
+                         dict(standard_name="cell_area", units="m2")),
+                    ]:
+                        var_dims = [self.name_ntiles_dim, *var_dims]
+                        shape = [len(self.tile_names), *[dims[dim] for dim in var_dims[1:]]]
+                        var = nc.createVariable(
+                            name, dtype, var_dims, fill_value=dtype.type(np.nan),
+                            **encoding.variable_kwargs(shape, dtype)
+                        )
+                        var.setncatts(attrs)
+                        variables.append(var)
+                    lons, lats, area = variables
+                elif tile.get_shape() != first.get_shape():
+                    raise ValueError(
+                        f"The tiles of a consolidated mosaic must have the same shape ({tile.name} is "
+                        f"{tile.get_shape()} but {first.name} is {first.get_shape()})"
+                    )
+                lats[i] = supergrid_lats
+                lons[i] = supergrid_lons
+                area[i] = tile.area
+                checksums.append(grid_checksum(supergrid_lats, supergrid_lons))
+            area.setncattr('grid_checksum', ' '.join(checksums))
+        return opath
+
+    def _tiles_with_supergrids(self):
+        """ Yields the tiles, with their supergrids (for mosaics that compute them on demand) """
+        yield from self.tiles
+
+    def load_consolidated_tiles(self, ds, lazy=False):
+        """ Loads the tiles of a loaded mosaic in the consolidated layout (see to_netcdf_consolidated) from its
+        dataset. If lazy is True, the tiles' supergrids are read on demand.
+        """
+        lats, lons, area = [
+            ds[get_da_name(ds, standard_name=standard_name)]
+            for standard_name in ["geographic_latitude", "geographic_longitude", "cell_area"]
+        ]
+        checksums = area.attrs.get('grid_checksum', '').split()
+        tiles = []
+        for i, tile_name in enumerate(self.tile_names):
+            tile_ds = xr.Dataset({GridspecTile.name_dummy: ds[tile_name]})
+            for da in [lats, lons, area]:
+                tile_ds[da.name] = da.isel({self.name_ntiles_dim: i})
+            tile_ds[area.name].attrs = dict(area.attrs, grid_checksum=checksums[i] if i < len(checksums) else '')
+            tile = GridspecTile()
+            if not tile.load(tile_ds, lazy=lazy):
+                raise RuntimeError(f"Failed to load gridspec tile: {tile_name}")
+            tiles.append(tile)
+        self._tiles = tiles
+
+    def to_zarr(self, store, write_tiles=True, workers=None, processes=False, encoding=None):
+        """ Writes the mosaic to a Zarr store, with each tile in a group named after it.
+
+        Unlike NetCDF files, the groups of a store can be written concurrently. With workers > 1, the tiles are
+        computed and written by a thread pool, or by worker processes if processes is True.
+        """
+        write_zarr_dataset(self.dump(), store)
+        if write_tiles:
+            write_tile = partial(_write_zarr_tile, store=str(store), encoding=encoding)
+            if workers is None or workers <= 1:
+                for tile, tile_name in zip(self.tiles, self.tile_names):
+                    write_tile(tile, tile_name)
+            else:
+                executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+                with executor_type(workers) as executor:
+                    list(executor.map(write_tile, self.tiles, self.tile_names))
+        return str(store)
+
+    def open_zarr(self, store, load_tiles=True, workers=None, processes=None, lazy=False) -> bool:
+        ok = self.load(open_zarr_dataset(store, lazy=lazy))
+        if ok and load_tiles:
+            self.load_zarr_tiles(store, workers=workers, processes=processes, lazy=lazy)
+        return ok
+
+    def load_zarr_tiles(self, store, workers=None, processes=None, lazy=False):
+        """ Loads the tiles of a loaded mosaic from the groups of a Zarr store (see load_tiles). Zarr reads aren't
+        serialized by a lock, so by default (processes is None) a thread pool loads the tiles if workers > 1.
+        """
+        if workers is None or workers <= 1:
+            for tile, tile_name in zip(self.tiles, self.tile_names):
+                if not tile.open_zarr(store, group=tile_name, lazy=lazy):
+                    raise RuntimeError(f"Failed to load gridspec tile: {tile_name} in {store}")
+        else:
+            executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with executor_type(workers) as executor:
+                self._tiles = list(executor.map(partial(load_tile, str(store), lazy), self.tile_names))
+
     def load(self, ds) -> bool:
         if len(get_da_name(ds, standard_name="grid_mosaic_spec", only_one=False)) != 1:
             return False
         self.name_dummy = get_da_name(ds, standard_name="grid_mosaic_spec")
-        self.name = ds[self.name_dummy].item().decode()
+        self.name = decode_string(ds[self.name_dummy].item())
         self.name_children = ds[self.name_dummy].attrs['children']
         self.name_contacts = ds[self.name_dummy].attrs['contact_regions']
-        self.tile_files_root = ds['gridlocation'].item().decode()
-        self.tile_names = [byte_arr.decode() for byte_arr in ds[self.name_children].values]
-        self.tile_filenames = [byte_arr.decode() for byte_arr in ds["gridfiles"].values]
-        self.contacts = [byte_arr.decode() for byte_arr in ds[self.name_contacts].values]
+        self.tile_files_root = decode_string(ds['gridlocation'].item())
+        self.tile_names = [decode_string(value) for value in ds[self.name_children].values]
+        self.tile_filenames = [decode_string(value) for value in ds["gridfiles"].values]
+        self.contacts = [decode_string(value) for value in ds[self.name_contacts].values]
         self.name_contact_index = ds[self.name_contacts].attrs['contact_index']
-        self.contact_indices = [byte_arr.decode() for byte_arr in ds[self.name_contact_index].values]
+        self.contact_indices = [decode_string(value) for value in ds[self.name_contact_index].values]
+        self.consolidated = ds[self.name_dummy].attrs.get('tile_layout') == 'consolidated'
         return True
 
-    def open_netcdf(self, filepath, load_tiles=True) -> bool:
-        ds = xr.open_dataset(filepath)
+    def open_netcdf(self, filepath, load_tiles=True, workers=None, processes=None, lazy=False) -> bool:
+        """ Opens a mosaic file. The tiles of a consolidated mosaic are loaded from the same file (see
+        to_netcdf_consolidated), and otherwise from the tile files (see load_tiles).
+        """
+        ds = xr.open_dataset(filepath, cache=not lazy)
         ok = self.load(ds)
         if ok and load_tiles:
-            for i, tile_path in enumerate(self.tile_paths(mosaic_dir=Path(filepath).parent)):
-                if not self.tiles[i].open_netcdf(tile_path):
-                    raise RuntimeError(f"Failed to load gridspec tile: {tile_path}")
+            if self.consolidated:
+                self.load_consolidated_tiles(ds, lazy=lazy)
+            else:
+                self.load_tiles(Path(filepath).parent, workers=workers, processes=processes, lazy=lazy)
         return ok
 
+    def load_tiles(self, mosaic_dir, workers=None, processes=None, lazy=False):
+        """ Loads the tile files of a loaded mosaic file in mosaic_dir.
+
+        With workers > 1, the tile files are loaded concurrently by worker processes, or by a thread pool if processes
+        is False. Reads through the netCDF4 library are serialized by xarray's locks, so threads don't read in
+        parallel. If lazy is True, the tiles' supergrids are read on demand (see GridspecTile.load).
+        """
+        if processes is None:
+            processes = True
+        tile_paths = self.tile_paths(mosaic_dir=mosaic_dir)
+        if workers is None or workers <= 1:
+            for i, tile_path in enumerate(tile_paths):
+                if not self.tiles[i].open_netcdf(tile_path, lazy=lazy):
+                    raise RuntimeError(f"Failed to load gridspec tile: {tile_path}")
+        else:
+            executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with executor_type(workers) as executor:
+                self._tiles = list(executor.map(partial(load_tile, lazy=lazy), tile_paths))
+
     def __eq__(self, other):
         names_are_equal = (
                 self.name == other.name and
@@ -390,8 +879,11 @@ class GridspecMosaic:
 
     def __str__(self):
         header = f"Gridspec mosaic  ({self.name}, {len(self.tile_filenames)} tiles, {len(self.contacts)} contacts)"
-        tile_desc = f"Tile files:      "
-        tile_desc += ", ".join([f'"{filepath}"' for filepath in self.tile_paths()])
+        if self.consolidated:
+            tile_desc = "Tile files:      (consolidated in the mosaic file)"
+        else:
+            tile_desc = f"Tile files:      "
+            tile_desc += ", ".join([f'"{filepath}"' for filepath in self.tile_paths()])
         tile_desc = "\n...              ".join(textwrap.wrap(tile_desc, 80))
         text = header + "\n" + tile_desc
         text += f"\n\nGridspec tiles:"
@@ -411,6 +903,9 @@ class CFSingleTile(LogicallyRectangularGrid):
 
     name_area = 'area'
 
+    # the (row, column) offsets of the 4 vertices of curvilinear cells' bounds, counterclockwise from the first corner
+    cf_vertex_offsets = [(0, 0), (0, 1), (1, 1), (1, 0)]
+
     def __init__(self, name=None, center_lats=None, center_lons=None, lat_bnds=None, lon_bnds=None):
         super().__init__()
         self.name = name
@@ -425,6 +920,16 @@ class CFSingleTile(LogicallyRectangularGrid):
     def is_curvilinear(self) -> bool:
         return not self.is_regular()
 
+    def grid_checksum(self) -> str:
+        return grid_checksum(self.center_lats, self.center_lons, self.lat_bnds, self.lon_bnds)
+
+    def _calc_area(self, block_size=None, workers=None) -> np.ndarray:
+        if self.is_regular():
+            return latlon_cell_area(self.lat_bnds, self.lon_bnds)
+        if self.supergrid_lats is None:
+            self._update_supergrids()
+        return super()._calc_area(block_size=block_size, workers=workers)
+
     def dump(self) -> xr.Dataset:
         ds = xr.Dataset()
 
@@ -454,13 +959,12 @@ class CFSingleTile(LogicallyRectangularGrid):
                 bounds=self.name_lat_bnds,
             )
         )
-        if self.supergrid_lats is None:
-            self._update_supergrids()
         ds[self.name_area] = xr.DataArray(
             self.area, dims=[self.name_dim1, self.name_dim2],
             attrs=dict(
                 standard_name="cell_area",
                 units="m2",
+                grid_checksum=self.grid_checksum(),
             )
         )
         return ds
@@ -490,13 +994,28 @@ class CFSingleTile(LogicallyRectangularGrid):
 
         if len(self.center_lons.shape) != 1:
             self.name_dim1, self.name_dim2 = ds[self.name_lons].dims[:2]
+        area_names = get_da_name(ds, standard_name="cell_area", only_one=False)
+        if len(area_names) == 1:
+            self.name_area = area_names[0]
+            self.set_stored_area(ds[self.name_area])
         return True
 
-    def to_netcdf(self, directory):
+    def to_netcdf(self, directory, encoding=None):
         directory = cwd_if_no_output_dir(directory)
         ds = self.dump()
         opath = str(directory.joinpath(f'{self.name}.nc'))
-        ds.to_netcdf(opath)
+        if encoding is None:
+            encoding = EncodingPolicy()
+        ds.to_netcdf(opath, encoding=encoding.encoding(ds, area=[self.name_area]))
+        return opath
+
+    def open_zarr(self, store) -> bool:
+        return self.load(open_zarr_dataset(store))
+
+    def to_zarr(self, directory, encoding=None):
+        """ Writes the tile to the Zarr store {name}.zarr in directory """
+        opath = str(cwd_if_no_output_dir(directory).joinpath(f'{self.name}.zarr'))
+        write_zarr_dataset(self.dump(), opath, encoding=encoding, area=[self.name_area])
         return opath
 
     def init_from_supergrids(self, supergrid_lats, supergrid_lons):
@@ -508,7 +1027,16 @@ class CFSingleTile(LogicallyRectangularGrid):
             lon_bnds = supergrid_lons[0::2]
             self.lon_bnds = np.transpose([lon_bnds[:-1], lon_bnds[1:]])
         else:
-            raise NotImplementedError("Not implemented yet")
+            self.center_lats = supergrid_lats[1::2, 1::2]
+            self.center_lons = supergrid_lons[1::2, 1::2]
+            nrows, ncols = self.center_lats.shape
+            self.lat_bnds = np.empty((nrows, ncols, 4))
+            self.lon_bnds = np.empty((nrows, ncols, 4))
+            corner_lats = supergrid_lats[0::2, 0::2]
+            corner_lons = supergrid_lons[0::2, 0::2]
+            for k, (i, j) in enumerate(self.cf_vertex_offsets):
+                self.lat_bnds[..., k] = corner_lats[i:nrows+i, j:ncols+j]
+                self.lon_bnds[..., k] = corner_lons[i:nrows+i, j:ncols+j]
 
     def __str__(self):
         minlon = f"{round(np.min(self.lon_bnds), 1)}°E"
@@ -520,36 +1048,124 @@ class CFSingleTile(LogicallyRectangularGrid):
         shape1 = self.center_lons.shape[-1]
         return f"CFSingleTile  ({shape0}x{shape1})      bounding box: {bbox}"
 
+    def _check_shared_vertices(self, atol=1e-6):
+        """ Raises a ValueError if neighbouring curvilinear cells' bounds disagree about a shared vertex """
+        nrows, ncols = self.lat_bnds.shape[:2]
+        for k, (ik, jk) in enumerate(self.cf_vertex_offsets):
+            for m, (im, jm) in enumerate(self.cf_vertex_offsets[k+1:], start=k+1):
+                # vertex k of cell (r, c) is vertex m of cell (r+di, c+dj)
+                di, dj = ik - im, jk - jm
+                cells = np.s_[max(0, -di):nrows - max(0, di), max(0, -dj):ncols - max(0, dj)]
+                neighbours = np.s_[max(0, di):nrows - max(0, -di), max(0, dj):ncols - max(0, -dj)]
+                dlat = self.lat_bnds[cells][..., k] - self.lat_bnds[neighbours][..., m]
+                dlon = self.lon_bnds[cells][..., k] - self.lon_bnds[neighbours][..., m]
+                dlon = ((dlon + 180) % 360 - 180) * np.cos(np.deg2rad(self.lat_bnds[cells][..., k]))
+                if not (np.all(np.abs(dlat) <= atol) and np.all(np.abs(dlon) <= atol)):
+                    raise ValueError(f"Neighbouring cells' bounds disagree about shared vertices ({k} and {m})")
+
     def _update_supergrids(self):
         if self.is_regular():
-            nlats = self.center_lats.shape[0]
-            nlons = self.center_lons.shape[0]
-            supergrid_lats = np.ndarray((nlats*2+1, nlons*2+1))
-            supergrid_lons = np.ndarray((nlats*2+1, nlons*2+1))
-            center_lats, center_lons = np.meshgrid(self.center_lats, self.center_lons, indexing='ij')
-            lat_bnds = np.append(self.lat_bnds[:, 0], self.lat_bnds[-1, 1])
-            lon_bnds = np.append(self.lon_bnds[:, 0], self.lon_bnds[-1, 1])
-            lat_bnds, lon_bnds = np.meshgrid(lat_bnds, lon_bnds, indexing='ij')
-            supergrid_lats[0::2, 0::2] = lat_bnds
-            supergrid_lats[1::2, 1::2] = center_lats
-            supergrid_lons[0::2, 0::2] = lon_bnds
-            supergrid_lons[1::2, 1::2] = center_lons
+            # regular grids keep 1D supergrids (see supergrids_2d)
+            supergrid_lats = np.empty(self.center_lats.shape[0]*2+1)
+            supergrid_lons = np.empty(self.center_lons.shape[0]*2+1)
+            supergrid_lats[0::2] = np.append(self.lat_bnds[:, 0], self.lat_bnds[-1, 1])
+            supergrid_lats[1::2] = self.center_lats
+            supergrid_lons[0::2] = np.append(self.lon_bnds[:, 0], self.lon_bnds[-1, 1])
+            supergrid_lons[1::2] = self.center_lons
             self.supergrid_lats = supergrid_lats
             self.supergrid_lons = supergrid_lons
         else:
-            raise NotImplementedError("Not implemented yet")
+            self._check_shared_vertices()
+            nrows, ncols = self.center_lats.shape
+            supergrid_lats = np.empty((nrows*2+1, ncols*2+1))
+            supergrid_lons = np.empty((nrows*2+1, ncols*2+1))
+            for supergrid, bnds in [(supergrid_lats, self.lat_bnds), (supergrid_lons, self.lon_bnds)]:
+                # the corners are each cell's first vertex, plus the last row and column from the other vertices
+                corners = supergrid[0::2, 0::2]
+                corners[:-1, :-1] = bnds[..., 0]
+                corners[:-1, -1] = bnds[:, -1, 1]
+                corners[-1, -1] = bnds[-1, -1, 2]
+                corners[-1, :-1] = bnds[-1, :, 3]
+            supergrid_lats[1::2, 1::2] = self.center_lats
+            supergrid_lons[1::2, 1::2] = self.center_lons
+            # the edge midpoints are the great circle midpoints of the corners on either side
+            for edges, first, second in [
+                (np.s_[0::2, 1::2], np.s_[0::2, 0:-1:2], np.s_[0::2, 2::2]),
+                (np.s_[1::2, 0::2], np.s_[0:-1:2, 0::2], np.s_[2::2, 0::2]),
+            ]:
+                supergrid_lats[edges], supergrid_lons[edges] = great_circle_midpoint(
+                    supergrid_lats[first], supergrid_lons[first], supergrid_lats[second], supergrid_lons[second]
+                )
+            self.supergrid_lats = supergrid_lats
+            self.supergrid_lons = supergrid_lons
+
 
+def _write_tile(tile, filepath, encoding=None):
+    tile.to_netcdf(filepath, encoding=encoding)
+    return filepath
 
-def load_mosaic(filename, load_tiles=True):
+
+def _write_zarr_tile(tile, group, store, encoding=None):
+    return tile.to_zarr(store, group=group, encoding=encoding)
+
+
+def _write_zarr_block(store, arrays, supergrid_rows, start, ncell_rows, block_rows):
+    """ Computes and writes block start:start+block_rows of a tile's (lats, lons, area) arrays in a Zarr store. The
+    supergrid row shared with the next block is left to it, so that each chunk is written by one block.
+    """
+    stop = min(start + block_rows, ncell_rows)
+    block_lats, block_lons = supergrid_rows(2 * start, 2 * stop + 1)
+    new_rows = 2 * (stop - start) + (1 if stop == ncell_rows else 0)
+    lats, lons, area = [zarr.open_array(store, path=path, mode='r+') for path in arrays]
+    lats[2 * start:2 * start + new_rows] = block_lats[:new_rows]
+    lons[2 * start:2 * start + new_rows] = block_lons[:new_rows]
+    area[start:stop] = LogicallyRectangularGrid(block_lats, block_lons).area
+
+
+def load_mosaic(filename, load_tiles=True, workers=None, processes=None, lazy=False):
+    """ Loads a mosaic from a mosaic file (with its tile files), or from a Zarr store. With workers > 1, the tiles are
+    loaded concurrently (see GridspecMosaic.load_tiles and load_zarr_tiles).
+    """
     mosaic = GridspecMosaic()
-    if not mosaic.open_netcdf(filename, load_tiles=load_tiles):
+    open_mosaic = mosaic.open_zarr if is_zarr_store(filename) else mosaic.open_netcdf
+    if not open_mosaic(filename, load_tiles=load_tiles, workers=workers, processes=processes, lazy=lazy):
         raise RuntimeError(f"Failed to load {filename} as a gridspec mosaic")
     return mosaic
 
 
-def load_tile(filename):
+def _check_not_overwritten(filename, opath):
+    if Path(opath).resolve() == Path(filename).resolve():
+        raise ValueError(f"The converted mosaic would overwrite {filename} (use another directory)")
+
+
+def consolidate_mosaic(filename, directory=None, output_filename=None, encoding=None) -> str:
+    """ Converts a mosaic (a mosaic file and its tile files) to the consolidated layout, a single file (see
+    GridspecMosaic.to_netcdf_consolidated). The tiles are read lazily and converted one at a time.
+    """
+    mosaic = load_mosaic(filename, lazy=True)
+    directory = cwd_if_no_output_dir(directory)
+    _check_not_overwritten(filename, directory.joinpath(output_filename or f'{mosaic.name}.nc'))
+    return mosaic.to_netcdf_consolidated(directory, filename=output_filename, encoding=encoding)
+
+
+def split_mosaic(filename, directory=None, encoding=None) -> Tuple[str, List[str]]:
+    """ Converts a consolidated mosaic to a mosaic file and tile files in directory (the reverse of
+    consolidate_mosaic). The tiles are read lazily and converted one at a time.
+    """
+    mosaic = load_mosaic(filename, lazy=True)
+    directory = cwd_if_no_output_dir(directory)
+    _check_not_overwritten(filename, directory.joinpath(f'{mosaic.name}.nc'))
+    return mosaic.to_netcdf(directory, encoding=encoding)
+
+
+def load_tile(filename, lazy=False, group=None):
+    """ Loads a tile from a tile file, or from a group of a Zarr store """
     tile = GridspecTile()
-    if not tile.open_netcdf(filename):
+    if is_zarr_store(filename):
+        ok = tile.open_zarr(filename, group=group, lazy=lazy)
+    else:
+        ok = tile.open_netcdf(filename, lazy=lazy)
+    if not ok:
         raise RuntimeError(f"Failed to load {filename} as a gridspec tile")
     return tile
 
@@ -1,8 +1,16 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import os.path
+import time
+
 import click
 from gridspec.gnom_cube_sphere.gcs_gridspec import GridspecGnomonicCubedSphere
 from gridspec.latlon import GridspecRegularLatLon
-from gridspec.base import GridspecMosaic, GridspecTile, CFSingleTile, load_mosaic
-from gridspec.misc.datafile_ops import join_datafiles, split_datafile, touch_datafiles
+from gridspec.base import GridspecMosaic, GridspecTile, CFSingleTile, consolidate_mosaic, is_zarr_store, load_mosaic, \
+    open_zarr_dataset, split_mosaic
+from gridspec.misc.datafile_ops import join_datafiles, load_tile_centers, split_datafile, touch_datafiles
+from gridspec.misc.encoding import CHUNK_BYTES, EncodingPolicy
+from gridspec.misc.grid_cache import GridFileCache
 
 output_dir_option_posargs=('-o', '--output-dir')
 output_dir_option_kwargs=dict(
@@ -11,6 +19,101 @@ output_dir_option_kwargs=dict(
     help="The directory that output files are written to."
 )
 
+cache_dir_posargs = ('--cache-dir',)
+cache_dir_kwargs = dict(
+    type=click.Path(file_okay=False, dir_okay=True, writable=True),
+    envvar='GRIDSPEC_CACHE_DIR',
+    default=None,
+    help="Directory for caching generated grids (env: GRIDSPEC_CACHE_DIR). No caching if not set."
+)
+
+cache_size_posargs = ('--cache-size',)
+cache_size_kwargs = dict(
+    type=click.IntRange(min=0),
+    envvar='GRIDSPEC_CACHE_SIZE',
+    default=10240,
+    metavar="MB",
+    show_default=True,
+    help="Maximum size of the grid cache in MB (env: GRIDSPEC_CACHE_SIZE)."
+)
+
+streaming_posargs = ('--streaming',)
+streaming_kwargs = dict(
+    is_flag=True,
+    default=False,
+    help="Compute and write one tile at a time to bound memory usage (for very large grids)."
+)
+
+block_rows_posargs = ('--block-rows',)
+block_rows_kwargs = dict(
+    type=click.IntRange(min=1),
+    default=None,
+    metavar="ROWS",
+    help="Compute and write tiles in blocks of ROWS rows of grid-boxes (implies --streaming)."
+)
+
+zarr_posargs = ('--zarr',)
+zarr_kwargs = dict(
+    is_flag=True,
+    default=False,
+    help="Write a Zarr store (a directory, with each tile in a group) instead of NetCDF files. Zarr stores are not "
+         "cached."
+)
+
+consolidated_posargs = ('--consolidated',)
+consolidated_kwargs = dict(
+    is_flag=True,
+    default=False,
+    help="Write the mosaic and its tiles to a single file (stacked along the tile dimension). Not valid with "
+         "--streaming, --block-rows, or --jobs."
+)
+
+jobs_posargs = ('-j', '--jobs')
+jobs_kwargs = dict(
+    type=click.IntRange(min=1),
+    default=1,
+    metavar="N",
+    help="Number of tiles that are computed and written concurrently."
+)
+
+complevel_posargs = ('-z', '--complevel')
+complevel_kwargs = dict(
+    type=click.IntRange(min=0, max=9),
+    default=None,
+    metavar="LEVEL",
+    help="Compress variables with zlib at LEVEL (0-9). Uncompressed by default; split and join keep the input's "
+         "compression unless an encoding option is given."
+)
+
+shuffle_posargs = ('--shuffle/--no-shuffle',)
+shuffle_kwargs = dict(
+    default=True,
+    help="Use the byte shuffle filter for compressed variables. Default is --shuffle."
+)
+
+chunk_size_posargs = ('--chunk-size',)
+chunk_size_kwargs = dict(
+    type=click.IntRange(min=1),
+    default=None,
+    metavar="KB",
+    help=f"Maximum size of the chunks of compressed variables in KB (default: {CHUNK_BYTES // 1024})."
+)
+
+float32_area_posargs = ('--float32-area',)
+float32_area_kwargs = dict(
+    is_flag=True,
+    default=False,
+    help="Store cell areas as float32."
+)
+
+significant_digits_posargs = ('--significant-digits',)
+significant_digits_kwargs = dict(
+    type=click.IntRange(min=1),
+    default=None,
+    metavar="N",
+    help="Quantize floating-point data variables to N significant digits (lossy)."
+)
+
 cs_size_posargs = ('N',)
 cs_size_kwargs = dict(
     type=click.IntRange(min=2)
@@ -40,6 +143,11 @@ mosaic_file_kwargs = dict(
     help="Mosaic file"
 )
 
+file_jobs_kwargs = dict(
+    jobs_kwargs,
+    help="Number of data files that are processed concurrently (by worker processes)."
+)
+
 tile_dim_posargs = ('-d', '--dim')
 tile_dim_kwargs = dict(
     type=click.STRING, metavar="NAME", required=True,
@@ -47,6 +155,120 @@ tile_dim_kwargs = dict(
 )
 
 
+def encoding_options(func):
+    """ Adds the options that make an EncodingPolicy (see encoding_policy) to a command """
+    for posargs, kwargs in reversed([
+        (complevel_posargs, complevel_kwargs),
+        (shuffle_posargs, shuffle_kwargs),
+        (chunk_size_posargs, chunk_size_kwargs),
+        (float32_area_posargs, float32_area_kwargs),
+        (significant_digits_posargs, significant_digits_kwargs),
+    ]):
+        func = click.option(*posargs, **kwargs)(func)
+    return func
+
+
+def encoding_policy(complevel, shuffle, chunk_size, float32_area, significant_digits):
+    """ Returns the EncodingPolicy of the encoding options, or None if none of them were given """
+    if complevel is None and shuffle and chunk_size is None and not float32_area and significant_digits is None:
+        return None
+    return EncodingPolicy(
+        complevel=complevel or 0, shuffle=shuffle,
+        chunk_bytes=CHUNK_BYTES if chunk_size is None else chunk_size * 1024,
+        float32_area=float32_area, significant_digits=significant_digits
+    )
+
+
+def run_batch(func, items, jobs):
+    """ Runs func(item) for each item, in a pool of jobs worker processes if jobs > 1. func returns (files, nbytes,
+    seconds). Failures are reported and skipped, and summarized at the end.
+    """
+    if jobs > 1:
+        executor = ProcessPoolExecutor(jobs)
+        futures = [executor.submit(func, item) for item in items]
+        results = (future.result for future in futures)
+    else:
+        executor = None
+        results = (partial(func, item) for item in items)
+    new_files = []
+    errors = []
+    total_bytes = 0
+    start = time.perf_counter()
+    try:
+        for item, result in zip(items, results):
+            try:
+                files, nbytes, seconds = result()
+            except Exception as e:
+                errors.append((item, e))
+                click.echo(f"  ! {item}: {e}")
+                continue
+            for file in files:
+                click.echo(f"  + {file}")
+            click.echo(f"    {item}: {nbytes / 1024**2:,.1f} MB in {seconds:.2f} s "
+                       f"({nbytes / 1024**2 / max(seconds, 1e-9):,.1f} MB/s)")
+            new_files.extend(files)
+            total_bytes += nbytes
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    seconds = time.perf_counter() - start
+    click.echo(f'\nCreated {len(new_files)} files ({total_bytes / 1024**2:,.1f} MB in {seconds:.2f} s, '
+               f'{total_bytes / 1024**2 / max(seconds, 1e-9):,.1f} MB/s).')
+    if errors:
+        click.echo(f'\nFailed to process {len(errors)} of {len(items)}:')
+        for item, e in errors:
+            click.echo(f'  {item}: {type(e).__name__}: {e}')
+        raise click.ClickException(f'{len(errors)} of {len(items)} failed')
+    return new_files
+
+
+def timed_split_datafile(datafile, **kwargs):
+    start = time.perf_counter()
+    files = split_datafile(datafile, **kwargs)
+    return files, os.path.getsize(datafile), time.perf_counter() - start
+
+
+def timed_join_datafiles(datafile_prefix, **kwargs):
+    start = time.perf_counter()
+    file = join_datafiles(datafile_prefix, **kwargs)
+    return [file], os.path.getsize(file), time.perf_counter() - start
+
+
+@lru_cache(maxsize=None)
+def cached_tile_centers(gridspec_file):
+    """ Loads the tile centers of a mosaic once per (worker) process, rather than sending them with every task """
+    return load_tile_centers(gridspec_file)
+
+
+def timed_touch_datafiles(datafile_prefix, gridspec_file, **kwargs):
+    tile_centers = cached_tile_centers(gridspec_file)
+    start = time.perf_counter()
+    files = touch_datafiles(
+        datafile_prefix=datafile_prefix, gridspec_file=gridspec_file, tile_centers=tile_centers, **kwargs
+    )
+    return files, sum(os.path.getsize(file) for file in files), time.perf_counter() - start
+
+
+def create_cached(cache_dir, cache_size, output_dir, grid_type, params, write_files, encoding=None):
+    """ Returns the files of the grid described by (grid_type, params) in output_dir. They are taken from the cache in
+    cache_dir if possible, otherwise they are written by write_files(output_dir) and added to the cache. Files written
+    with an EncodingPolicy are cached separately.
+    """
+    if encoding is not None:
+        params = dict(params, encoding=vars(encoding))
+    if cache_dir is None:
+        return write_files(output_dir)
+    cache = GridFileCache(cache_dir, max_bytes=cache_size * 1024**2)
+    key = cache.key(grid_type, **params)
+    files = cache.fetch(key, output_dir)
+    if files is not None:
+        click.echo(f'Using cached grid files ({cache_dir})')
+        return files
+    files = write_files(output_dir)
+    cache.store(key, files)
+    return files
+
+
 @click.group()
 def create():
     """ Create a gridspec file
@@ -57,20 +279,50 @@ def create():
 @create.command()
 @click.argument(*cs_size_posargs, **cs_size_kwargs)
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def gcs(n, output_dir):
+@click.option(*cache_dir_posargs, **cache_dir_kwargs)
+@click.option(*cache_size_posargs, **cache_size_kwargs)
+@click.option(*streaming_posargs, **streaming_kwargs)
+@click.option(*block_rows_posargs, **block_rows_kwargs)
+@click.option(*jobs_posargs, **jobs_kwargs)
+@click.option(*zarr_posargs, **zarr_kwargs)
+@click.option(*consolidated_posargs, **consolidated_kwargs)
+@encoding_options
+def gcs(n, output_dir, cache_dir, cache_size, streaming, block_rows, jobs, zarr, consolidated, **encoding_kwargs):
     """Create a Gnomonic Cubed-Sphere (GCS) grid.
 
     N is the cubed-sphere size (resolution). For example, N=180 for a C180 grid.
     """
     click.echo(f'Creating gnomonic cubed-sphere grid.')
     click.echo(f'  Cubed-sphere size: C{n}\n')
-    gs = GridspecGnomonicCubedSphere(n)
-    click.echo('Writing mosaic and tile files')
-    mosaic_file, tile_files = gs.to_netcdf(directory=output_dir)
-    click.echo(f'  + {mosaic_file}')
-    for tile_file in tile_files:
-        click.echo(f'  + {tile_file}')
-    click.echo(f"\nCreated {len([mosaic_file,*tile_files])} files.")
+    if zarr and consolidated:
+        raise click.BadParameter('--consolidated is not valid with --zarr')
+    if consolidated and (streaming or block_rows is not None or jobs > 1):
+        # the consolidated file is written one whole tile at a time, by one process
+        raise click.BadParameter('--consolidated is not valid with --streaming, --block-rows, or --jobs')
+    encoding = encoding_policy(**encoding_kwargs)
+
+    def write_files(directory):
+        gs = GridspecGnomonicCubedSphere(n, streaming=streaming or block_rows is not None)
+        if zarr:
+            click.echo('Writing Zarr store')
+            store = os.path.join(directory, f'{gs.name}.zarr')
+            return [gs.to_zarr(store, block_rows=block_rows, workers=jobs, encoding=encoding)]
+        if consolidated:
+            click.echo('Writing consolidated mosaic file')
+            return [gs.to_netcdf_consolidated(directory=directory, encoding=encoding)]
+        click.echo('Writing mosaic and tile files')
+        mosaic_file, tile_files = gs.to_netcdf(
+            directory=directory, block_rows=block_rows, workers=jobs, encoding=encoding
+        )
+        return [mosaic_file, *tile_files]
+
+    params = dict(n=n, consolidated=True) if consolidated else dict(n=n)
+    files = create_cached(
+        None if zarr else cache_dir, cache_size, output_dir, 'gcs', params, write_files, encoding=encoding
+    )
+    for file in files:
+        click.echo(f'  + {file}')
+    click.echo(f"\nCreated {len(files)} files.")
 
 
 @create.command()
@@ -78,7 +330,16 @@ def gcs(n, output_dir):
 @click.option(*stretch_factor_posargs, **stretch_factor_kwargs)
 @click.option(*target_point_posargs, **target_point_kwargs)
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def sgcs(n, stretch_factor, target_point, output_dir):
+@click.option(*cache_dir_posargs, **cache_dir_kwargs)
+@click.option(*cache_size_posargs, **cache_size_kwargs)
+@click.option(*streaming_posargs, **streaming_kwargs)
+@click.option(*block_rows_posargs, **block_rows_kwargs)
+@click.option(*jobs_posargs, **jobs_kwargs)
+@click.option(*zarr_posargs, **zarr_kwargs)
+@click.option(*consolidated_posargs, **consolidated_kwargs)
+@encoding_options
+def sgcs(n, stretch_factor, target_point, output_dir, cache_dir, cache_size, streaming, block_rows, jobs, zarr,
+         consolidated, **encoding_kwargs):
     """Create a Stretched Gnomonic Cubed Sphere (SGCS) grid.
 
     N is the cubed-sphere size (resolution). For example, N=180 for a C180 grid.
@@ -94,13 +355,38 @@ def sgcs(n, stretch_factor, target_point, output_dir):
     click.echo(f'  Cubed-sphere size: C{n}')
     click.echo(f'  Stretch factor:    {round(stretch_factor, 2)}')
     click.echo(f'  Target point:      {round(target_lat, 2)}°N, {round(target_lon, 2)}°E\n')
-    gs = GridspecGnomonicCubedSphere(n, stretch_factor=stretch_factor, target_lat=target_lat, target_lon=target_lon)
-    click.echo('Writing mosaic and tile files.')
-    mosaic_file, tile_files = gs.to_netcdf(directory=output_dir)
-    click.echo(f'  + {mosaic_file}')
-    for tile_file in tile_files:
-        click.echo(f'  + {tile_file}')
-    click.echo(f"\nCreated {len([mosaic_file,*tile_files])} files.")
+    if zarr and consolidated:
+        raise click.BadParameter('--consolidated is not valid with --zarr')
+    if consolidated and (streaming or block_rows is not None or jobs > 1):
+        # the consolidated file is written one whole tile at a time, by one process
+        raise click.BadParameter('--consolidated is not valid with --streaming, --block-rows, or --jobs')
+    encoding = encoding_policy(**encoding_kwargs)
+
+    def write_files(directory):
+        gs = GridspecGnomonicCubedSphere(n, stretch_factor=stretch_factor, target_lat=target_lat, target_lon=target_lon,
+                                         streaming=streaming or block_rows is not None)
+        if zarr:
+            click.echo('Writing Zarr store.')
+            store = os.path.join(directory, f'{gs.name}.zarr')
+            return [gs.to_zarr(store, block_rows=block_rows, workers=jobs, encoding=encoding)]
+        if consolidated:
+            click.echo('Writing consolidated mosaic file.')
+            return [gs.to_netcdf_consolidated(directory=directory, encoding=encoding)]
+        click.echo('Writing mosaic and tile files.')
+        mosaic_file, tile_files = gs.to_netcdf(
+            directory=directory, block_rows=block_rows, workers=jobs, encoding=encoding
+        )
+        return [mosaic_file, *tile_files]
+
+    params = dict(n=n, stretch_factor=stretch_factor, target_lat=target_lat, target_lon=target_lon)
+    if consolidated:
+        params['consolidated'] = True
+    files = create_cached(
+        None if zarr else cache_dir, cache_size, output_dir, 'sgcs', params, write_files, encoding=encoding
+    )
+    for file in files:
+        click.echo(f'  + {file}')
+    click.echo(f"\nCreated {len(files)} files.")
 
 
 @create.command()
@@ -123,7 +409,12 @@ def sgcs(n, stretch_factor, target_point, output_dir):
               default=True,
               help="Specifies dateline-centered or a dateline edge. Default is --dateline-edge.")
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def latlon(ny, nx, bbox, polar_edge, half_polar, dateline_edge, output_dir):
+@click.option(*cache_dir_posargs, **cache_dir_kwargs)
+@click.option(*cache_size_posargs, **cache_size_kwargs)
+@click.option(*zarr_posargs, **zarr_kwargs)
+@encoding_options
+def latlon(ny, nx, bbox, polar_edge, half_polar, dateline_edge, output_dir, cache_dir, cache_size, zarr,
+           **encoding_kwargs):
     """Create a regular lat-lon grid.
 
     NY is the number of latitude boxes. NX is the number of longitude boxes.
@@ -148,34 +439,60 @@ def latlon(ny, nx, bbox, polar_edge, half_polar, dateline_edge, output_dir):
     click.echo(f'  Pole-centered:       {pole_centered}')
     click.echo(f'  Half-polar:          {half_polar}')
     click.echo(f'  Dateline-centered:   {dateline_centered}')
-    tile = GridspecRegularLatLon(
-        nx=nx, ny=ny, bbox=bbox,
-        pole_centered=pole_centered, dateline_centered=dateline_centered, half_polar=half_polar
+    encoding = encoding_policy(**encoding_kwargs)
+
+    def write_files(directory):
+        tile = GridspecRegularLatLon(
+            nx=nx, ny=ny, bbox=bbox,
+            pole_centered=pole_centered, dateline_centered=dateline_centered, half_polar=half_polar
+        )
+        if zarr:
+            click.echo('\nWriting Zarr store.')
+            return [tile.to_zarr(directory=directory, encoding=encoding)]
+        click.echo('\nWriting mosaic and tile files.')
+        return [tile.to_netcdf(directory=directory, encoding=encoding)]
+
+    params = dict(ny=ny, nx=nx, bbox=list(bbox), pole_centered=pole_centered, dateline_centered=dateline_centered,
+                  half_polar=half_polar)
+    files = create_cached(
+        None if zarr else cache_dir, cache_size, output_dir, 'latlon', params, write_files, encoding=encoding
     )
-    click.echo('\nWriting mosaic and tile files.')
-    ofile = tile.to_netcdf(directory=output_dir)
-    click.echo(f'  + {ofile}')
+    for file in files:
+        click.echo(f'  + {file}')
     click.echo(f"\nCreated 1 file.")
 
 
 
 @click.command()
-@click.argument('filepath', type=click.Path(exists=True, file_okay=True, dir_okay=False, writable=False, readable=True))
+@click.argument('filepath', type=click.Path(exists=True, file_okay=True, dir_okay=True, writable=False, readable=True))
 def dump(filepath):
-    """Print information about a gridspec file
+    """Print information about a gridspec file (or Zarr store)
     """
     import xarray as xr
-    ds = xr.open_dataset(filepath)
+    from pathlib import Path
+    is_zarr = is_zarr_store(filepath)
+    if is_zarr:
+        ds = open_zarr_dataset(filepath, lazy=True)
+    elif Path(filepath).is_dir():
+        raise click.BadParameter(f"{filepath} is a directory but not a Zarr store")
+    else:
+        ds = xr.open_dataset(filepath, cache=False)
 
+    # tiles are loaded lazily so that only the corners and centers that are printed are read
     mosaic = GridspecMosaic()
     is_mosaic = mosaic.load(ds)
     if is_mosaic:
-        mosaic = load_mosaic(filepath)  # load_mosaic also loads all the tiles
+        if is_zarr:
+            mosaic.load_zarr_tiles(filepath, lazy=True)
+        elif mosaic.consolidated:
+            mosaic.load_consolidated_tiles(ds, lazy=True)
+        else:
+            mosaic.load_tiles(Path(filepath).parent, lazy=True)
         print(mosaic)
         return
 
     tile = GridspecTile()
-    is_tile = tile.load(ds)
+    is_tile = tile.load(ds, lazy=True)
     if is_tile:
         print(tile)
         return
@@ -200,20 +517,21 @@ def utils():
 @click.option(*mosaic_file_posargs, **mosaic_file_kwargs)
 @click.option(*tile_dim_posargs, **tile_dim_kwargs)
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def split(datafile, mosaic, dim, output_dir):
+@click.option(*jobs_posargs, **file_jobs_kwargs)
+@encoding_options
+def split(datafile, mosaic, dim, output_dir, jobs, **encoding_kwargs):
     """
     Split a (stacked) data file into separate data files for each tile.
 
     DATAFILE... are the data files that are split.
     """
     click.echo(f'Splitting {len(datafile)} datafiles along dimension "{dim}"')
-    new_files = []
-    for f in datafile:
-        split_files = split_datafile(f, dim, mosaic, directory=output_dir)
-        for file in split_files:
-            click.echo(f"  + {file}")
-        new_files.extend(split_files)
-    click.echo(f'\nCreated {len(new_files)} files.')
+    mosaic = load_mosaic(mosaic, load_tiles=False)
+    split_file = partial(
+        timed_split_datafile, tile_dim=dim, gridspec_file=mosaic, directory=output_dir,
+        encoding=encoding_policy(**encoding_kwargs)
+    )
+    run_batch(split_file, list(datafile), jobs)
 
 @utils.command()
 @click.argument('file_prefix', nargs=-1, required=True, type=click.STRING)
@@ -222,20 +540,19 @@ def split(datafile, mosaic, dim, output_dir):
               required=True,
               help="Path to gridspec mosaic")
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def touch(file_prefix, mosaic, output_dir):
+@click.option(*jobs_posargs, **file_jobs_kwargs)
+@encoding_options
+def touch(file_prefix, mosaic, output_dir, jobs, **encoding_kwargs):
     """
     Create new empty data files. This is useful for the --dstdatafile argument in ESMF_Regrid.
 
     FILE_PREFIX... are the name prefixes for the empty data files that are created.
     """
     click.echo(f'Creating empty data files.')
-    new_files = []
-    for fprefix in file_prefix:
-        files = touch_datafiles(mosaic, fprefix, directory=output_dir)
-        new_files.extend(files)
-        for f in files:
-            click.echo(f"  + {f}")
-    click.echo(f'\nCreated {len(new_files)} files.')
+    touch_files = partial(
+        timed_touch_datafiles, gridspec_file=mosaic, directory=output_dir, encoding=encoding_policy(**encoding_kwargs)
+    )
+    run_batch(touch_files, list(file_prefix), jobs)
 
 
 @utils.command()
@@ -246,14 +563,15 @@ def touch(file_prefix, mosaic, output_dir):
               type=click.File(), metavar="JSONSPEC", required=True,
               help="The joining spec (JSON) file path")
 @click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
-def join(file_prefix, mosaic, dim, spec, output_dir):
+@click.option(*jobs_posargs, **file_jobs_kwargs)
+@encoding_options
+def join(file_prefix, mosaic, dim, spec, output_dir, jobs, **encoding_kwargs):
     """
     Create new empty data files. This is useful for the --dstdatafile argument in ESMF_Regrid.
 
     FILE_PREFIX... are the name prefixes for the empty data files that are created.
     """
     import json
-    from pathlib import Path
     click.echo('Loading join specification')
     join_spec = json.loads(spec.read())
 
@@ -275,13 +593,39 @@ def join(file_prefix, mosaic, dim, spec, output_dir):
         transpose=None
 
     click.echo(f'\nJoining data files.')
-    new_files = []
-    for fprefix in file_prefix:
-        file = join_datafiles(fprefix, mosaic, tile_dim=dim, directory=output_dir, rename_dict=rename_pairs, coord_attrs_dict=coord_attrs, transpose=transpose)
-        new_files.append(file)
-        filesize = round(Path(file).stat().st_size / 1024**2)
-        click.echo(f"  + {file} ({filesize:,} MB)")
-    click.echo(f'\nCreated {len(new_files)} files.')
+    join_files = partial(
+        timed_join_datafiles, gridspec_file=load_mosaic(mosaic, load_tiles=False), tile_dim=dim, directory=output_dir,
+        rename_dict=rename_pairs, coord_attrs_dict=coord_attrs, transpose=transpose,
+        encoding=encoding_policy(**encoding_kwargs)
+    )
+    run_batch(join_files, list(file_prefix), jobs)
 
 
+@utils.command()
+@click.argument('mosaic_file',
+                type=click.Path(exists=True, file_okay=True, dir_okay=False, writable=False, readable=True))
+@click.option('--consolidated/--split', default=True,
+              help="Convert to a consolidated (single file) mosaic, or to a mosaic file and tile files. "
+                   "Default is --consolidated.")
+@click.option(*output_dir_option_posargs, **output_dir_option_kwargs)
+@encoding_options
+def convert(mosaic_file, consolidated, output_dir, **encoding_kwargs):
+    """
+    Convert a mosaic between the split layout (a mosaic file and tile files) and the consolidated layout (one file).
 
+    MOSAIC_FILE is the mosaic file that is converted.
+    """
+    encoding = encoding_policy(**encoding_kwargs)
+    try:
+        if consolidated:
+            click.echo('Consolidating mosaic')
+            files = [consolidate_mosaic(mosaic_file, directory=output_dir, encoding=encoding)]
+        else:
+            click.echo('Splitting mosaic into tile files')
+            mosaic_path, tile_paths = split_mosaic(mosaic_file, directory=output_dir, encoding=encoding)
+            files = [mosaic_path, *tile_paths]
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for file in files:
+        click.echo(f'  + {file}')
+    click.echo(f"\nCreated {len(files)} files.")
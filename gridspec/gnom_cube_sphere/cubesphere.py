@@ -25,27 +25,37 @@ import numpy as np
 from itertools import product
 
 
-def csgrid_GMAO(res, offset=-10):
+def csgrid_GMAO(res, offset=-10, edges_only=False, method=None):
     """
     Return cubedsphere coordinates with GMAO face orientation
     Parameters
     ----------
     res: cubed-sphere Resolution
+    offset: longitude offset (degrees) of the first face
+    edges_only: if True, only 'lon_b' and 'lat_b' are computed and returned
+    method: 'reflection' or 'analytic' (see CSGrid). Defaults to 'analytic'
+        if res >= ANALYTIC_MIN_RES, otherwise 'reflection'.
     This function was originally written by Jiawei Zhuange and included
     in package cubedsphere: https://github.com/JiaweiZhuang/cubedsphere
     """
 
-    CS = CSGrid(res, offset=offset)
+    if method is None:
+        method = 'analytic' if res >= ANALYTIC_MIN_RES else 'reflection'
+    CS = CSGrid(res, offset=offset, edges_only=edges_only, method=method)
 
-    lon = CS.lon_center.transpose(2, 0, 1)
     lon_b = CS.lon_edge.transpose(2, 0, 1)
-    lat = CS.lat_center.transpose(2, 0, 1)
     lat_b = CS.lat_edge.transpose(2, 0, 1)
-
-    lon[lon < 0] += 360
     lon_b[lon_b < 0] += 360
 
-    for a in [lon, lon_b, lat, lat_b]:
+    if edges_only:
+        grids = {'lon_b': lon_b, 'lat_b': lat_b}
+    else:
+        lon = CS.lon_center.transpose(2, 0, 1)
+        lat = CS.lat_center.transpose(2, 0, 1)
+        lon[lon < 0] += 360
+        grids = {'lon': lon, 'lat': lat, 'lon_b': lon_b, 'lat_b': lat_b}
+
+    for a in grids.values():
 
         for tile in [0, 1, 3, 4]:
             a[tile] = a[tile].T
@@ -56,12 +66,90 @@ def csgrid_GMAO(res, offset=-10):
 
         a[2], a[5] = a[5].copy(), a[2].copy()  # swap north&south pole
 
-    return {'lon': lon, 'lat': lat, 'lon_b': lon_b, 'lat_b': lat_b}
+    return grids
+
+
+def csgrid_GMAO_rows(res, tile, start, stop, offset=-10):
+    """
+    Return the edge longitudes and latitudes of rows start:stop of one tile
+    of csgrid_GMAO(res, offset, edges_only=True, method='analytic'). Only
+    the requested rows are computed.
+    """
+    n = res + 1
+    face, transposed, flip_rows, flip_cols = _GMAO_TILE_ORIENTATIONS[tile]
+    rows = np.arange(n)[start:stop]
+    cols = np.arange(n)
+    if flip_rows:
+        rows = n - 1 - rows
+    if flip_cols:
+        cols = n - 1 - cols
+
+    t = _gnomonic_edge_coordinates(res)
+    if transposed:
+        t_i, t_j = t[cols][np.newaxis, :], t[rows][:, np.newaxis]
+    else:
+        t_i, t_j = t[rows][:, np.newaxis], t[cols][np.newaxis, :]
+    lon_b, lat_b = _gnomonic_points(t_i, t_j, _FACE_ROTATION_MATRICES[face])
+
+    _cleanup_edges(lon_b, lat_b)
+    np.rad2deg(lon_b, out=lon_b)
+    np.rad2deg(lat_b, out=lat_b)
+    lon_b += offset
+    lon_b[lon_b < 0] += 360
+    return lon_b, lat_b
 
 
 _INV_SQRT_3 = 1.0 / np.sqrt(3.0)
 _ASIN_INV_SQRT_3 = np.arcsin(_INV_SQRT_3)
 
+# Solid body rotations (angle, axis) that map face 0 onto faces 1-5
+_FACE_ROTATIONS = {
+    1: [(-np.pi / 2., 'z')],
+    2: [(-np.pi / 2., 'z'), (np.pi / 2., 'x')],
+    3: [(np.pi, 'z'), (np.pi / 2., 'x')],
+    4: [(np.pi / 2., 'z'), (np.pi / 2., 'y')],
+    5: [(np.pi / 2., 'y'), (0., 'z')],
+}
+
+
+def _rotation_matrix(rot_ang, rot_axis):
+    """ Returns the 3x3 matrix of the solid body rotation in rotate_sphere_3D """
+    cos_ang = np.cos(rot_ang)
+    sin_ang = np.sin(rot_ang)
+    if rot_axis == 'x':
+        return np.array([[1., 0., 0.], [0., cos_ang, sin_ang], [0., -sin_ang, cos_ang]])
+    elif rot_axis == 'y':
+        return np.array([[cos_ang, 0., -sin_ang], [0., 1., 0.], [sin_ang, 0., cos_ang]])
+    elif rot_axis == 'z':
+        return np.array([[cos_ang, sin_ang, 0.], [-sin_ang, cos_ang, 0.], [0., 0., 1.]])
+    raise ValueError(f"Invalid rotation axis: {rot_axis}")
+
+
+def _face_rotation_matrix(rotations):
+    matrix = np.identity(3)
+    for rot_ang, rot_axis in rotations:
+        matrix = _rotation_matrix(rot_ang, rot_axis) @ matrix
+    return matrix
+
+
+# Shape (6, 3, 3); face 0 is the identity
+_FACE_ROTATION_MATRICES = np.array(
+    [np.identity(3)] + [_face_rotation_matrix(_FACE_ROTATIONS[face]) for face in range(1, 6)]
+)
+
+# GMAO tile -> (CSGrid face, transposed, rows flipped, columns flipped) for the reorientation done in csgrid_GMAO
+_GMAO_TILE_ORIENTATIONS = [
+    (0, True, False, False),
+    (1, True, False, False),
+    (5, False, True, False),
+    (3, True, True, True),
+    (4, True, True, True),
+    (2, False, True, False),
+]
+
+# csgrid_GMAO uses the analytic generator by default for res >= ANALYTIC_MIN_RES
+ANALYTIC_MIN_RES = 1440
+
 
 class CSGrid(object):
     """Generator for cubed-sphere grid geometries.
@@ -83,7 +171,7 @@ class CSGrid(object):
     in package cubedsphere: https://github.com/JiaweiZhuang/cubedsphere
     """
 
-    def __init__(self, c, offset=None):
+    def __init__(self, c, offset=None, edges_only=False, method='reflection'):
         """
         Parameters
         ----------
@@ -102,6 +190,15 @@ class CSGrid(object):
             Degrees to offset the first faces' edge in the latitudinal
             direction. If not passed, then the western edge of the first face
             will align with the prime meridian.
+        edges_only: bool (optional)
+            If True, only {lon,lat}_edge are computed. The center and cartesian
+            attributes are set to None.
+        method: str (optional)
+            'reflection' builds the first face with the GMAO mirror
+            construction and rotates it onto the other faces. 'analytic'
+            computes all six faces in closed form. The two agree to within
+            1e-12 radians of great circle distance; longitudes at the poles
+            are arbitrary and may differ.
        This function was originally written by Jiawei Zhuange and included
        in package cubedsphere: https://github.com/JiaweiZhuang/cubedsphere
         """
@@ -109,11 +206,57 @@ class CSGrid(object):
         self.delta_y = 2. * _ASIN_INV_SQRT_3 / c
         self.nx = self.ny = c + 1
         self.offset = offset
+        self.edges_only = edges_only
+        self.method = method
 
         self._initialize()
 
     def _initialize(self):
 
+        if self.method == 'reflection':
+            lon_edge, lat_edge = self._reflection_edges()
+        elif self.method == 'analytic':
+            lon_edge, lat_edge = self._analytic_edges()
+        else:
+            raise ValueError(f"Unknown cubed-sphere generator method: {self.method}")
+
+        #######################################################################
+        # CLEANUP GRID
+        #######################################################################
+
+        _cleanup_edges(lon_edge, lat_edge)
+
+        if self.edges_only:
+            xyz_edge = xyz_ctr = lon_ctr_deg = lat_ctr_deg = None
+        else:
+            xyz_edge, xyz_ctr, lon_ctr_deg, lat_ctr_deg = self._centroids(lon_edge, lat_edge)
+
+        lon_edge_deg = np.rad2deg(lon_edge, out=lon_edge)
+        lat_edge_deg = np.rad2deg(lat_edge, out=lat_edge)
+
+        if self.offset is not None:
+            lon_edge_deg += self.offset
+            if lon_ctr_deg is not None:
+                lon_ctr_deg += self.offset
+
+        #######################################################################
+        # CACHE
+        #######################################################################
+
+        self.lon_center = lon_ctr_deg
+        self.lat_center = lat_ctr_deg
+
+        self.lon_edge = lon_edge_deg
+        self.lat_edge = lat_edge_deg
+
+        self.xyz_center = xyz_ctr
+        self.xyz_edge = xyz_edge
+
+    def _reflection_edges(self):
+        """ Returns the edge longitudes and latitudes (radians) of all six
+        faces, with shape (c+1, c+1, 6), using the GMAO mirror construction.
+        """
+
         c = self.c
         nx, ny = self.nx, self.ny
 
@@ -137,97 +280,72 @@ class CSGrid(object):
         norm = np.sqrt(np.sum(xyzCross**2))
         xyzCross /= norm
 
-        for i in range(1, c):
-
-            lonRef, latRef = lambda_rad[0, i], theta_rad[0, i]
-            xyzRef = np.asarray(latlon_to_cartesian(lonRef, latRef, ))
+        # Reflect the west edge through the mirror plane
+        xRef, yRef, zRef = latlon_to_cartesian(lambda_rad[0, 1:c], theta_rad[0, 1:c])
 
-            xyzDot = np.sum(xyzCross * xyzRef)
-            xyzImg = xyzRef - (2. * xyzDot * xyzCross)
+        xyzDot = xyzCross[0] * xRef + xyzCross[1] * yRef + xyzCross[2] * zRef
+        xImg = xRef - (2. * xyzDot * xyzCross[0])
+        yImg = yRef - (2. * xyzDot * xyzCross[1])
+        zImg = zRef - (2. * xyzDot * xyzCross[2])
 
-            xsImg, ysImg, zsImg = xyzImg
-            lonImg, latImg = cartesian_to_latlon(xsImg, ysImg, zsImg)
+        lonImg, latImg = vec_cartesian_to_latlon(xImg, yImg, zImg)
 
-            lambda_rad[i, 0] = lonImg
-            lambda_rad[i, -1] = lonImg
-            theta_rad[i, 0] = latImg
-            theta_rad[i, -1] = -latImg
+        lambda_rad[1:c, 0] = lonImg
+        lambda_rad[1:c, -1] = lonImg
+        theta_rad[1:c, 0] = latImg
+        theta_rad[1:c, -1] = -latImg
 
         pp = np.zeros([3, c + 1, c + 1])
 
         # Set the four corners
-        # print("CORNERS")
         for i, j in product([0, -1], [0, -1]):
-            # print(i, j)
             pp[:, i, j] = latlon_to_cartesian(
                 lambda_rad[i, j], theta_rad[i, j])
 
         # Map the edges on the sphere back to the cube.
         #Note that all intersections are at x = -rsq3
-        # print("EDGES")
-        for ij in range(1, c + 1):
-            # print(ij)
-            pp[:, 0, ij] = latlon_to_cartesian(
-                lambda_rad[0, ij], theta_rad[0, ij])
-            pp[1, 0, ij] = -pp[1, 0, ij] * _INV_SQRT_3 / pp[0, 0, ij]
-            pp[2, 0, ij] = -pp[2, 0, ij] * _INV_SQRT_3 / pp[0, 0, ij]
-
-            pp[:, ij, 0] = latlon_to_cartesian(
-                lambda_rad[ij, 0], theta_rad[ij, 0])
-            pp[1, ij, 0] = -pp[1, ij, 0] * _INV_SQRT_3 / pp[0, ij, 0]
-            pp[2, ij, 0] = -pp[2, ij, 0] * _INV_SQRT_3 / pp[0, ij, 0]
+        for edge, lam, theta in [(pp[:, 0, 1:], lambda_rad[0, 1:], theta_rad[0, 1:]),
+                                 (pp[:, 1:, 0], lambda_rad[1:, 0], theta_rad[1:, 0])]:
+            edge[...] = latlon_to_cartesian(lam, theta)
+            edge[1] = -edge[1] * _INV_SQRT_3 / edge[0]
+            edge[2] = -edge[2] * _INV_SQRT_3 / edge[0]
 
         # # Map interiors
         pp[0, :, :] = -_INV_SQRT_3
-        # print("INTERIOR")
-        for i in range(1, c + 1):
-            for j in range(1, c + 1):
-                # Copy y-z face of the cube along j=1
-                pp[1, i, j] = pp[1, i, 0]
-                # Copy along i=1
-                pp[2, i, j] = pp[2, 0, j]
+        # Copy y-z face of the cube along j=1
+        pp[1, 1:, 1:] = pp[1, 1:, 0, np.newaxis]
+        # Copy along i=1
+        pp[2, 1:, 1:] = pp[2, np.newaxis, 0, 1:]
 
-        _pp = pp.copy()
-        llr, ttr = vec_cartesian_to_latlon(_pp[0], _pp[1], _pp[2])
-
-        lambda_rad, theta_rad = llr.copy(), ttr.copy()
+        lambda_rad, theta_rad = vec_cartesian_to_latlon(pp[0], pp[1], pp[2])
 
         # Make grid symmetrical to i = im/2 + 1
-        for j in range(1, c + 1):
-            for i in range(1, c + 1):
-                # print("({}, {}) -> ({}, {})".format(i, 0, i, j))
-                lambda_rad[i, j] = lambda_rad[i, 0]
-
-        for j in range(c + 1):
-            for i in range(c // 2):
-                isymm = c - i
-                # print(isymm)
-                avgPt = 0.5 * (lambda_rad[i, j] - lambda_rad[isymm, j])
-                # print(lambda_rad[i, j], lambda_rad[isymm, j], avgPt)
-                lambda_rad[i, j] = avgPt + np.pi
-                lambda_rad[isymm, j] = np.pi - avgPt
-
-                avgPt = 0.5 * (theta_rad[i, j] + theta_rad[isymm, j])
-                theta_rad[i, j] = avgPt
-                theta_rad[isymm, j] = avgPt
+        lambda_rad[1:, 1:] = lambda_rad[1:, 0, np.newaxis]
+
+        half = c // 2
+        lower = slice(0, half)
+        upper = slice(c, c - half, -1)  # isymm = c - i
+
+        avgPt = 0.5 * (lambda_rad[lower, :] - lambda_rad[upper, :])
+        lambda_rad[lower, :] = avgPt + np.pi
+        lambda_rad[upper, :] = np.pi - avgPt
+
+        avgPt = 0.5 * (theta_rad[lower, :] + theta_rad[upper, :])
+        theta_rad[lower, :] = avgPt
+        theta_rad[upper, :] = avgPt
 
         # Make grid symmetrical to j = im/2 + 1
-        for j in range(c // 2):
-            jsymm = c - j
-            for i in range(1, c + 1):
-                avgPt = 0.5 * (lambda_rad[i, j] + lambda_rad[i, jsymm])
-                lambda_rad[i, j] = avgPt
-                lambda_rad[i, jsymm] = avgPt
+        avgPt = 0.5 * (lambda_rad[1:, lower] + lambda_rad[1:, upper])
+        lambda_rad[1:, lower] = avgPt
+        lambda_rad[1:, upper] = avgPt
 
-                avgPt = 0.5 * (theta_rad[i, j] - theta_rad[i, jsymm])
-                theta_rad[i, j] = avgPt
-                theta_rad[i, jsymm] = -avgPt
+        avgPt = 0.5 * (theta_rad[1:, lower] - theta_rad[1:, upper])
+        theta_rad[1:, lower] = avgPt
+        theta_rad[1:, upper] = -avgPt
 
         # Final correction
         lambda_rad -= np.pi
 
-        llr, ttr = lambda_rad.copy(), theta_rad.copy()
-
         #######################################################################
         # MIRROR GRIDS
         #######################################################################
@@ -235,147 +353,95 @@ class CSGrid(object):
         new_xgrid = np.zeros((c + 1, c + 1, 6))
         new_ygrid = np.zeros((c + 1, c + 1, 6))
 
-        xgrid = llr.copy()
-        ygrid = ttr.copy()
+        xgrid = lambda_rad
+        ygrid = theta_rad
 
-        new_xgrid[..., 0] = xgrid.copy()
-        new_ygrid[..., 0] = ygrid.copy()
+        new_xgrid[..., 0] = xgrid
+        new_ygrid[..., 0] = ygrid
 
         # radius = 6370.0e3
         radius = 1.
 
-        for face in range(1, 6):
-            for j in range(c + 1):
-                for i in range(c + 1):
-                    x = xgrid[i, j]
-                    y = ygrid[i, j]
-                    z = radius
-
-                    if face == 1:
-                        # Rotate about z only
-                        new_xyz = rotate_sphere_3D(x, y, z, -np.pi / 2., 'z')
-
-                    elif face == 2:
-                        # Rotate about z, then x
-                        temp_xyz = rotate_sphere_3D(x, y, z, -np.pi / 2., 'z')
-                        x, y, z = temp_xyz[:]
-                        new_xyz = rotate_sphere_3D(x, y, z, np.pi / 2., 'x')
+        for face, rotations in _FACE_ROTATIONS.items():
+            x, y, z = xgrid, ygrid, radius
+            for rot_ang, rot_axis in rotations:
+                x, y, z = rotate_sphere_3D(x, y, z, rot_ang, rot_axis)
 
-                    elif face == 3:
-                        temp_xyz = rotate_sphere_3D(x, y, z, np.pi, 'z')
-                        x, y, z = temp_xyz[:]
-                        new_xyz = rotate_sphere_3D(x, y, z, np.pi / 2., 'x')
+            new_xgrid[..., face] = x
+            new_ygrid[..., face] = y
 
-                        if ((c % 2) != 0) and (j == c // 2 - 1):
-                            print(i, j, face)
-                            new_xyz = (np.pi, *new_xyz)
+        return new_xgrid, new_ygrid
 
-                    elif face == 4:
-                        temp_xyz = rotate_sphere_3D(x, y, z, np.pi / 2., 'z')
-                        x, y, z = temp_xyz[:]
-                        new_xyz = rotate_sphere_3D(x, y, z, np.pi / 2., 'y')
+    def _analytic_edges(self):
+        """ Returns the edge longitudes and latitudes (radians) of all six
+        faces, with shape (c+1, c+1, 6), in closed form.
 
-                    elif face == 5:
-                        temp_xyz = rotate_sphere_3D(x, y, z, np.pi / 2., 'y')
-                        x, y, z = temp_xyz[:]
-                        new_xyz = rotate_sphere_3D(x, y, z, 0., 'z')
-
-                    # print((x, y, z), "\n", new_xyz, "\n" + "--"*40)
-
-                    new_x, new_y, _ = new_xyz
-                    new_xgrid[i, j, face] = new_x
-                    new_ygrid[i, j, face] = new_y
-
-        lon_edge, lat_edge = new_xgrid.copy(), new_ygrid.copy()
+        The GMAO construction puts the edge points of each face at equal
+        latitude increments along its bounding great circle. Projected onto
+        the cube face x = 1/sqrt(3), edge point k is at sqrt(2)*tan(theta_k)/sqrt(3),
+        and interior points are the intersections of those lines. The other
+        faces are face 0 rotated by the matrices of _FACE_ROTATIONS.
+        """
+        t = _gnomonic_edge_coordinates(self.c)
+        R = np.moveaxis(_FACE_ROTATION_MATRICES, 0, -1)[..., np.newaxis, np.newaxis]
+        lon_edge, lat_edge = _gnomonic_points(t[:, np.newaxis], t[np.newaxis, :], R)
+        return np.moveaxis(lon_edge, 0, -1), np.moveaxis(lat_edge, 0, -1)
+
+    @staticmethod
+    def _centroids(lon_edge, lat_edge):
+        """ Returns the cartesian edges, cartesian centers, and the center
+        longitudes and latitudes (degrees) for edges given in radians.
+        """
 
         #######################################################################
-        # CLEANUP GRID
+        # COMPUTE CELL CENTROIDS
         #######################################################################
 
-        for i, j, f in product(range(c + 1), range(c + 1), range(6)):
-            new_lon = lon_edge[i, j, f]
-            if new_lon < 0:
-                new_lon += 2 * np.pi
-            if np.abs(new_lon) < 1e-10:
-                new_lon = 0.
-            lon_edge[i, j, f] = new_lon
+        # Convert from lat-lon back to cartesian
+        xyz_edge = np.array(latlon_to_cartesian(lon_edge, lat_edge))
 
-            if np.abs(lat_edge[i, j, f]) < 1e-10:
-                lat_edge[i, j, f] = 0.
+        # Sum the four corners of each cell
+        e_mid = xyz_edge[:, :-1, :-1] + xyz_edge[:, 1:, :-1]
+        e_mid += xyz_edge[:, 1:, 1:]
+        e_mid += xyz_edge[:, :-1, 1:]
+        e_abs = np.sqrt(e_mid[0] * e_mid[0] + e_mid[1] * e_mid[1] + e_mid[2] * e_mid[2])
+        np.divide(e_mid, e_abs, out=e_mid, where=e_abs > 0)
 
-        lon_edge_deg = np.rad2deg(lon_edge)
-        lat_edge_deg = np.rad2deg(lat_edge)
+        xyz_ctr = e_mid
+        lon_ctr, lat_ctr = vec_cartesian_to_latlon(xyz_ctr[0], xyz_ctr[1], xyz_ctr[2])
 
-        #######################################################################
-        # COMPUTE CELL CENTROIDS
-        #######################################################################
+        return xyz_edge, xyz_ctr, np.rad2deg(lon_ctr, out=lon_ctr), np.rad2deg(lat_ctr, out=lat_ctr)
 
-        lon_ctr = np.zeros((c, c, 6))
-        lat_ctr = np.zeros((c, c, 6))
-        xyz_ctr = np.zeros((3, c, c, 6))
-        xyz_edge = np.zeros((3, c + 1, c + 1, 6))
-
-        for f in range(6):
-            for i in range(c):
-                last_x = (i == (c - 1))
-                for j in range(c):
-                    last_y = (j == (c - 1))
-
-                    # Get the four corners
-                    lat_corner = [
-                        lat_edge[i, j, f],
-                        lat_edge[i + 1, j, f],
-                        lat_edge[i + 1, j + 1, f],
-                        lat_edge[i, j + 1, f]]
-                    lon_corner = [
-                        lon_edge[i, j, f],
-                        lon_edge[i + 1, j, f],
-                        lon_edge[i + 1, j + 1, f],
-                        lon_edge[i, j + 1, f]]
-
-                    # Convert from lat-lon back to cartesian
-                    xyz_corner = np.asarray(
-                        vec_latlon_to_cartesian(
-                            lon_corner, lat_corner))
-
-                    # Store the edge information
-                    xyz_edge[:, i, j, f] = xyz_corner[:, 0]
-                    if last_x:
-                        xyz_edge[:, i + 1, j, f] = xyz_corner[:, 1]
-                    if last_x or last_y:
-                        xyz_edge[:, i + 1, j + 1, f] = xyz_corner[:, 2]
-                    if last_y:
-                        xyz_edge[:, i, j + 1, f] = xyz_corner[:, 3]
-
-                    e_mid = np.sum(xyz_corner, axis=1)
-                    e_abs = np.sqrt(np.sum(e_mid * e_mid))
-                    if e_abs > 0:
-                        e_mid = e_mid / e_abs
-
-                    xyz_ctr[:, i, j, f] = e_mid
-                    _lon, _lat = cartesian_to_latlon(*e_mid)
-                    lon_ctr[i, j, f] = _lon
-                    lat_ctr[i, j, f] = _lat
-
-        lon_ctr_deg = np.rad2deg(lon_ctr)
-        lat_ctr_deg = np.rad2deg(lat_ctr)
 
-        if self.offset is not None:
-            lon_edge_deg += self.offset
-            lon_ctr_deg += self.offset
+def _gnomonic_edge_coordinates(c):
+    """ Returns the c+1 edge point coordinates along a face edge of the cube
+    x = 1/sqrt(3). See CSGrid._analytic_edges.
+    """
+    theta = -_ASIN_INV_SQRT_3 + (2. * _ASIN_INV_SQRT_3 / c * np.arange(c + 1))
+    t = np.sqrt(2.) * _INV_SQRT_3 * np.tan(theta)
+    return 0.5 * (t - t[::-1])  # exactly antisymmetric about the face center
 
-        #######################################################################
-        # CACHE
-        #######################################################################
 
-        self.lon_center = lon_ctr_deg
-        self.lat_center = lat_ctr_deg
+def _gnomonic_points(t_i, t_j, R):
+    """ Returns the longitudes and latitudes (radians) of the face 0 cube
+    points (1/sqrt(3), t_i, t_j) rotated by R. t_i and t_j broadcast against
+    each other, and each R[k, l] broadcasts against the result.
+    """
+    norm = np.sqrt(_INV_SQRT_3 * _INV_SQRT_3 + t_i * t_i + t_j * t_j)
+    x0 = _INV_SQRT_3 / norm
+    y0 = t_i / norm
+    z0 = t_j / norm
+    x = R[0, 0] * x0 + R[0, 1] * y0 + R[0, 2] * z0
+    y = R[1, 0] * x0 + R[1, 1] * y0 + R[1, 2] * z0
+    z = R[2, 0] * x0 + R[2, 1] * y0 + R[2, 2] * z0
+    return np.arctan2(y, x), np.arctan2(z, np.sqrt(x * x + y * y))
 
-        self.lon_edge = lon_edge_deg
-        self.lat_edge = lat_edge_deg
 
-        self.xyz_center = xyz_ctr
-        self.xyz_edge = xyz_edge
+def _cleanup_edges(lon_edge, lat_edge):
+    """ Wraps longitudes (radians) to [0, 2pi) and zeroes values within 1e-10 of 0, in place """
+    lon_edge[lon_edge < 0] += 2 * np.pi
+    lon_edge[np.abs(lon_edge) < 1e-10] = 0.
+    lat_edge[np.abs(lat_edge) < 1e-10] = 0.
 
 
 def latlon_to_cartesian(lon, lat):
@@ -393,7 +459,8 @@ def latlon_to_cartesian(lon, lat):
     return x, y, z
 
 
-vec_latlon_to_cartesian = np.vectorize(latlon_to_cartesian)
+# latlon_to_cartesian is already elementwise
+vec_latlon_to_cartesian = latlon_to_cartesian
 
 
 def cartesian_to_latlon(x, y, z, ret_xyz=False):
@@ -424,7 +491,25 @@ def cartesian_to_latlon(x, y, z, ret_xyz=False):
         return lon, lat
 
 
-vec_cartesian_to_latlon = np.vectorize(cartesian_to_latlon)
+def vec_cartesian_to_latlon(x, y, z):
+    """ Elementwise version of cartesian_to_latlon for arrays of cartesian
+    coordinates. Gives the same results as applying cartesian_to_latlon to
+    each point.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    z = np.asarray(z, dtype=float)
+    vector_length = np.sqrt(x * x + y * y + z * z)
+    x = x / vector_length
+    y = y / vector_length
+    z = z / vector_length
+
+    lon = np.arctan2(y, x)
+    lon[(np.abs(x) + np.abs(y)) < 1e-20] = 0.
+    lon[lon < 0.] += 2 * np.pi
+
+    lat = np.arcsin(z)
+    return lon, lat
 
 
 def spherical_to_cartesian(theta, phi, r=1):
@@ -450,10 +535,10 @@ def cartesian_to_spherical(x, y, z):
     This function was originally written by Jiawei Zhuange and included
     in package cubedsphere: https://github.com/JiaweiZhuang/cubedsphere
     """
-    r = np.sqrt(x**2 + y**2 + z**2)
+    r = np.sqrt(x*x + y*y + z*z)
     #theta = np.arccos(z / r)
     theta = np.arctan2(y, x)
-    phi = np.arctan2(z, np.sqrt(x**2 + y**2))
+    phi = np.arctan2(z, np.sqrt(x*x + y*y))
 
     # if np.abs(x) < 1e-16:
     #     phi = np.pi
@@ -1,14 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import List
 
 import pygeohash as pgh
 
-from gridspec.gnom_cube_sphere.cubesphere import csgrid_GMAO
-from gridspec.gnom_cube_sphere.schmidt import scs_transform
-from gridspec.base import GridspecMosaic, GridspecTile
+from gridspec.gnom_cube_sphere import supergrid_cache
+from gridspec.gnom_cube_sphere.cubesphere import csgrid_GMAO, csgrid_GMAO_rows
+from gridspec.gnom_cube_sphere.schmidt import scs_transform_inplace
+from gridspec.base import GridspecMosaic, GridspecTile, cwd_if_no_output_dir
+
+
+class StreamingTile(GridspecTile):
+    """ A tile of a streaming mosaic. Its supergrids are computed (by supergrid_rows, see
+    GridspecTile.to_netcdf_streaming) when they are first accessed, and then kept.
+    """
+    def __init__(self, supergrid_rows, shape, name=None, attrs=None):
+        self.supergrid_rows = supergrid_rows
+        self.shape = shape
+        super().__init__(name=name, attrs=attrs)
+
+    @property
+    def supergrid_lats(self):
+        if self._supergrid_lats is None:
+            self._compute_supergrids()
+        return self._supergrid_lats
+
+    @supergrid_lats.setter
+    def supergrid_lats(self, v):
+        self._supergrid_lats = v
+
+    @property
+    def supergrid_lons(self):
+        if self._supergrid_lons is None:
+            self._compute_supergrids()
+        return self._supergrid_lons
+
+    @supergrid_lons.setter
+    def supergrid_lons(self, v):
+        self._supergrid_lons = v
+
+    def _compute_supergrids(self):
+        self._supergrid_lats, self._supergrid_lons = self.supergrid_rows(0, self.shape[0])
 
 
 class GridspecGnomonicCubedSphere(GridspecMosaic):
-    def __init__(self, cs_size, name=None, tile_names=None, tile_filenames=None, stretch_factor=1, target_lat=-90, target_lon=170):
+    def __init__(self, cs_size, name=None, tile_names=None, tile_filenames=None, stretch_factor=1, target_lat=-90,
+                 target_lon=170, cache=None, streaming=False):
+        """ A gnomonic cubed-sphere mosaic, optionally stretched (Schmidt transform).
+
+        If streaming is True, the supergrids are not computed here. Instead, to_netcdf() computes each tile (in
+        blocks of rows, optionally) and writes it straight to its file, so peak memory is about one tile. The tiles of
+        a streaming mosaic are StreamingTiles, which compute their supergrids only if they are accessed.
+        """
         do_schmidt = stretch_factor != 1 or target_lat != -90 or target_lon != 170
         if name is None:
             if not do_schmidt:
@@ -37,7 +80,11 @@ class GridspecGnomonicCubedSphere(GridspecMosaic):
             filler_dict['tile_name'] = tnames[-1]
             filenames.append(tile_filenames.format(**filler_dict))
 
-        supergrid_lat, supergrid_lon = self.calc_supergrid_latlon(cs_size, stretch_factor, target_lat, target_lon)
+        self.cs_size = cs_size
+        self.stretch_factor = stretch_factor
+        self.target_lat = target_lat
+        self.target_lon = target_lon
+        self.streaming = streaming
         tile_attrs = dict(
             geometry="spherical",
             north_pole="0.0 90.0",
@@ -45,42 +92,137 @@ class GridspecGnomonicCubedSphere(GridspecMosaic):
             discretization="logically_rectangular",
             conformal="FALSE"
         )
+        if streaming:
+            shape = (cs_size * 2 + 1, cs_size * 2 + 1)
+            tiles = [StreamingTile(
+                self.tile_supergrid_rows(i), shape, name=tnames[i], attrs=dict(tile_attrs)
+            ) for i in range(len(tnames))]
+        else:
+            supergrid_lat, supergrid_lon = self.calc_supergrid_latlon(
+                cs_size, stretch_factor, target_lat, target_lon, cache=cache
+            )
+            tiles = [GridspecTile(
+                name=tnames[i],
+                supergrid_lats=supergrid_lat[i],
+                supergrid_lons=supergrid_lon[i],
+                attrs=tile_attrs
+
+            ) for i in range(len(tnames))]
         super(GridspecGnomonicCubedSphere, self).__init__(
             name=name,
             tile_filenames=filenames,
             contacts=self.get_contacts(name, tnames),
             contact_indices=self.get_contact_indices(cs_size),
-            tiles=[GridspecTile(
-                name=tnames[i],
-                supergrid_lats=supergrid_lat[i, ...],
-                supergrid_lons=supergrid_lon[i, ...],
-                attrs=tile_attrs
+            tiles=tiles
+        )
 
-            ) for i in range(len(tnames))]
+    def tile_supergrid_rows(self, tile):
+        """ Returns a function that computes the supergrid rows start:stop of a tile (see calc_supergrid_rows) """
+        return partial(
+            self.calc_supergrid_rows, self.cs_size, tile,
+            stretch_factor=self.stretch_factor, target_lat=self.target_lat, target_lon=self.target_lon
         )
 
+    def to_netcdf(self, directory=None, write_tiles=True, workers=None, processes=False, block_rows=None,
+                  encoding=None):
+        """ Writes the mosaic (and tiles). See GridspecMosaic.to_netcdf. block_rows is the number of rows of cells that
+        are computed and written at a time by a streaming mosaic (default: whole tiles). Streaming mosaics always use
+        worker processes if workers > 1.
+        """
+        if block_rows is not None and not self.streaming:
+            raise ValueError("block_rows is only valid for streaming mosaics")
+        if not self.streaming:
+            return super().to_netcdf(
+                directory=directory, write_tiles=write_tiles, workers=workers, processes=processes, encoding=encoding
+            )
+        opath = super().to_netcdf(directory=directory, write_tiles=False)
+        if not write_tiles:
+            return opath
+        shape = (self.cs_size * 2 + 1, self.cs_size * 2 + 1)
+        tile_paths = self.tile_paths(mosaic_dir=cwd_if_no_output_dir(directory))
+        jobs = []
+        for tile_path, tile in zip(tile_paths, self.tiles):
+            jobs.append(partial(
+                tile.to_netcdf_streaming, tile_path, shape, tile.supergrid_rows, block_rows=block_rows,
+                encoding=encoding
+            ))
+        if workers is None or workers <= 1:
+            for job in jobs:
+                job()
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                for future in [executor.submit(job) for job in jobs]:
+                    future.result()
+        return opath, tile_paths
+
+    def _tiles_with_supergrids(self):
+        """ Yields the tiles. The tiles of a streaming mosaic are computed one at a time. """
+        if not self.streaming:
+            yield from self.tiles
+            return
+        for tile in self.tiles:
+            # a copy, so that the tile doesn't keep its supergrids
+            supergrid_lats, supergrid_lons = tile.supergrid_rows(0, tile.shape[0])
+            yield GridspecTile(tile.name, supergrid_lats, supergrid_lons, attrs=tile.attrs)
+
+    def to_zarr(self, store, write_tiles=True, workers=None, processes=False, block_rows=None, encoding=None):
+        """ Writes the mosaic to a Zarr store. See GridspecMosaic.to_zarr. The tiles of a streaming mosaic are
+        written in blocks of block_rows rows of cells (see GridspecTile.to_zarr_streaming), which are computed and
+        written concurrently by worker processes if workers > 1.
+        """
+        if block_rows is not None and not self.streaming:
+            raise ValueError("block_rows is only valid for streaming mosaics")
+        if not self.streaming:
+            return super().to_zarr(
+                store, write_tiles=write_tiles, workers=workers, processes=processes, encoding=encoding
+            )
+        super().to_zarr(store, write_tiles=False)
+        if write_tiles:
+            shape = (self.cs_size * 2 + 1, self.cs_size * 2 + 1)
+            for tile, tile_name in zip(self.tiles, self.tile_names):
+                tile.to_zarr_streaming(
+                    store, shape, tile.supergrid_rows, group=tile_name, block_rows=block_rows, workers=workers,
+                    encoding=encoding
+                )
+        return str(store)
+
+    @staticmethod
+    def calc_supergrid_rows(cs_size, tile, start, stop, stretch_factor=1, target_lat=-90, target_lon=170):
+        """ Returns the supergrid latitudes and longitudes of rows start:stop of one tile. This uses the analytic
+        generator, which agrees with calc_supergrid_latlon to ~1e-12 degrees.
+        """
+        do_schmidt = stretch_factor != 1 or target_lat != -90 or target_lon != 170
+        offset = 0 if do_schmidt else -10
+        supergrid_lon, supergrid_lat = csgrid_GMAO_rows(cs_size*2, tile, start, stop, offset)
+        if do_schmidt:
+            scs_transform_inplace(supergrid_lon, supergrid_lat, stretch_factor, target_lon, target_lat)
+        return supergrid_lat, supergrid_lon
+
     @staticmethod
-    def calc_supergrid_latlon(cs_size, stretch_factor=1, target_lat=-90, target_lon=170):
+    def calc_supergrid_latlon(cs_size, stretch_factor=1, target_lat=-90, target_lon=170, cache=None):
+        """ Returns the supergrid latitudes and longitudes with shape (6, 2N+1, 2N+1).
+
+        The unstretched supergrid is taken from cache (a SupergridCache). If cache is None, the module's default_cache
+        is used, which keeps nothing in memory unless GRIDSPEC_SUPERGRID_CACHE_SIZE is set. If cache is False, the
+        supergrid is always generated.
+        """
         do_schmidt = stretch_factor != 1 or target_lat != -90 or target_lon != 170
         if do_schmidt:
             offset = 0
         else:
             offset = -10
 
-        supergrid = csgrid_GMAO(cs_size*2, offset)
-        supergrid_lon = supergrid['lon_b']
-        supergrid_lat = supergrid['lat_b']
+        if cache is False:
+            supergrid = csgrid_GMAO(cs_size*2, offset, edges_only=True)
+            supergrid_lon = supergrid['lon_b']
+            supergrid_lat = supergrid['lat_b']
+        else:
+            if cache is None:
+                cache = supergrid_cache.default_cache
+            supergrid_lat, supergrid_lon = cache.get(cs_size*2, offset)
 
         if do_schmidt:
-            for f in range(6):
-                lon = supergrid_lon[f,...].flatten()
-                lat = supergrid_lat[f, ...].flatten()
-
-                lon, lat = scs_transform(
-                    lon, lat, stretch_factor, target_lon, target_lat
-                )
-                supergrid_lon[f, ...] = lon.reshape((cs_size * 2 + 1, cs_size * 2 + 1))
-                supergrid_lat[f, ...] = lat.reshape((cs_size * 2 + 1, cs_size * 2 + 1))
+            scs_transform_inplace(supergrid_lon, supergrid_lat, stretch_factor, target_lon, target_lat)
 
         return supergrid_lat, supergrid_lon
 
@@ -58,10 +58,19 @@ def schmidt_transform(x, y, s):
     return x, y
 
 
-def scs_transform(x, y, s, tx, ty):
-    # Convert xy to radians
-    x = x * np.pi / 180
-    y = y * np.pi / 180
+def rotation_matrix(k, theta):
+    """ Returns the 3x3 matrix that rotates vectors by theta about the unit axis k (same as rotate_vectors) """
+    k = np.asarray(k, dtype=float)
+    k_cross = np.array([
+        [0, -k[2], k[1]],
+        [k[2], 0, -k[0]],
+        [-k[1], k[0], 0],
+    ])
+    return np.cos(theta) * np.identity(3) + np.sin(theta) * k_cross + (1 - np.cos(theta)) * np.outer(k, k)
+
+
+def scs_rotation_matrix(tx, ty):
+    """ Returns the matrix that rotates the Schmidt-transformed grid so that its target point is (tx, ty) in degrees """
     tx = tx * np.pi / 180
     ty = ty * np.pi / 180
     # Calculate rotation about x, and z axes
@@ -69,19 +78,64 @@ def scs_transform(x, y, s, tx, ty):
     y0 = -np.pi / 2
     theta_x = ty - y0
     theta_z = tx - x0
-    # Apply schmidt transform
-    x, y = schmidt_transform(x, y, s)
-    # Convert to cartesian coordinates
-    x, y, z = spherical_to_cartesian(x, y)
-    # Rotate about x axis
     xaxis = np.array([0, 1, 0])
-    x, y, z = rotate_vectors(x, y, z, xaxis, theta_x)
-    # Rotate about z axis
     zaxis = np.array([0, 0, 1])
-    x, y, z = rotate_vectors(x, y, z, zaxis, theta_z)
-    # Convert back to spherical coordinates
-    x, y = cartesian_to_spherical(x, y, z)
-    # Convert back to degrees and return
-    x = x * 180 / np.pi
-    y = y * 180 / np.pi
-    return x, y
\ No newline at end of file
+    return rotation_matrix(zaxis, theta_z) @ rotation_matrix(xaxis, theta_x)
+
+
+def scs_transform_inplace(x, y, s, tx, ty, buffersize=65536):
+    """ Schmidt-transforms and rotates longitudes x and latitudes y (degrees) in place.
+
+    x and y are float64 arrays of the same (arbitrary) shape, e.g. all six (2N+1, 2N+1) supergrid faces at once. They
+    are processed in blocks of buffersize elements with reusable work buffers, so no full-size temporaries are made.
+    """
+    D = (1 - s ** 2) / (1 + s ** 2)
+    R = scs_rotation_matrix(tx, ty)
+    work = np.empty((4, buffersize))
+    with np.nditer([x, y], flags=['external_loop', 'buffered', 'zerosize_ok'],
+                   op_flags=[['readwrite'], ['readwrite']], buffersize=buffersize) as it:
+        for lon, lat in it:
+            _scs_block(lon, lat, D, R, *work[:, :lon.size])
+
+
+def _scs_block(lon, lat, D, R, w0, w1, w2, w3):
+    np.deg2rad(lon, out=lon)
+    np.deg2rad(lat, out=lat)
+    # Apply schmidt transform
+    np.sin(lat, out=w0)
+    np.multiply(w0, D, out=w1)
+    w1 += 1
+    w0 += D
+    w0 /= w1
+    np.arcsin(w0, out=lat)
+    # Convert to cartesian coordinates (x: w2, y: w3, z: w0)
+    np.cos(lat, out=w1)
+    np.cos(lon, out=w2)
+    w2 *= w1
+    np.sin(lon, out=w3)
+    w3 *= w1
+    # Rotate (x': lon, y': lat, z': w0)
+    for row, out in zip(R[:2], (lon, lat)):
+        np.multiply(w2, row[0], out=out)
+        np.multiply(w3, row[1], out=w1)
+        out += w1
+        np.multiply(w0, row[2], out=w1)
+        out += w1
+    w2 *= R[2, 0]
+    w3 *= R[2, 1]
+    w2 += w3
+    w0 *= R[2, 2]
+    w0 += w2
+    # Convert back to spherical coordinates in degrees
+    np.arctan2(lat, lon, out=lon)
+    np.clip(w0, -1, 1, out=w0)
+    np.arcsin(w0, out=lat)
+    np.rad2deg(lon, out=lon)
+    np.rad2deg(lat, out=lat)
+
+
+def scs_transform(x, y, s, tx, ty):
+    x = np.atleast_1d(np.array(x, dtype=float))
+    y = np.atleast_1d(np.array(y, dtype=float))
+    scs_transform_inplace(x, y, s, tx, ty)
+    return x, y
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import os
+from pathlib import Path
+import tempfile
+import warnings
+
+import numpy as np
+
+from gridspec.gnom_cube_sphere.cubesphere import csgrid_GMAO
+
+# Bump when the output of csgrid_GMAO changes so that stale files on disk are not used
+_DISK_FORMAT_VERSION = 1
+
+
+class SupergridCache:
+    """ Memoizes unstretched cubed-sphere supergrids (the edges from csgrid_GMAO).
+
+    Supergrids are kept in memory in a least-recently-used cache of at most max_bytes. If directory is given, they are
+    also stored there as .npy files so that other processes (and later sessions) can reuse them.
+
+    Stretched grids with different stretch factors and target points share the same unstretched supergrid, so a
+    parameter sweep only generates it once.
+    """
+    def __init__(self, max_bytes=2**30, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, res, offset, method=None):
+        """ Returns (lat_b, lon_b) for csgrid_GMAO(res, offset, method=method). The caller may modify the arrays. They
+        are copies if the supergrid is kept in memory (and otherwise they aren't, so peak memory isn't doubled).
+        """
+        key = (res, float(offset), method)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        else:
+            entry = self._load(key)
+            if entry is None:
+                supergrid = csgrid_GMAO(res, offset, edges_only=True, method=method)
+                lat_b, lon_b = supergrid['lat_b'], supergrid['lon_b']
+                # the supergrid is only stacked (copied) if it is kept
+                if self.directory is None and lat_b.nbytes + lon_b.nbytes > self.max_bytes:
+                    return lat_b, lon_b
+                entry = np.stack([lat_b, lon_b])
+                self._store(key, entry)
+            if not self._insert(key, entry):
+                return entry[0], entry[1]
+        return entry[0].copy(), entry[1].copy()
+
+    def _insert(self, key, entry) -> bool:
+        if entry.nbytes > self.max_bytes:
+            return False
+        entry.setflags(write=False)
+        self._entries[key] = entry
+        while self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+        return True
+
+    def _path(self, key) -> Path:
+        res, offset, method = key
+        return Path(self.directory).joinpath(f"c{res}_o{offset:g}_{method}_v{_DISK_FORMAT_VERSION}.npy")
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        if not path.exists():
+            return None
+        return np.load(path)
+
+    def _store(self, key, entry):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so that concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.npy.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, entry)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _cache_size_from_env() -> int:
+    """ Returns the size of the default cache in bytes, from GRIDSPEC_SUPERGRID_CACHE_SIZE (in MB) """
+    value = os.environ.get('GRIDSPEC_SUPERGRID_CACHE_SIZE', '0')
+    try:
+        size = int(value)
+    except ValueError:
+        size = -1
+    if size < 0:
+        warnings.warn(f"Invalid GRIDSPEC_SUPERGRID_CACHE_SIZE: {value!r} (expected a size in MB); not caching supergrids")
+        return 0
+    return size * 1024**2
+
+
+# supergrids are only kept in memory if GRIDSPEC_SUPERGRID_CACHE_SIZE (in MB) is set, since they are big (about 800 MB
+# at C1440)
+default_cache = SupergridCache(max_bytes=_cache_size_from_env())
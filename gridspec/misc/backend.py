@@ -0,0 +1,96 @@
+import os
+import warnings
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ['numpy', 'numba']
+
+# the largest difference between the backends' spherical excesses (in steradians, see set_backend)
+SPHERICAL_EXCESS_TOLERANCE = 4 * np.spacing(2 * np.pi)
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != 'numba' or numba is not None]
+
+
+def get_backend() -> str:
+    """ Returns the name of the backend used by the compute kernels """
+    return _backend
+
+
+def set_backend(name):
+    """ Selects the backend used by the compute kernels: 'numpy', 'numba' (requires numba), or 'auto' (numba if it is
+    installed, otherwise numpy). The default is taken from the GRIDSPEC_BACKEND environment variable (numpy if unset).
+
+    The backends evaluate the same expressions in the same order, but numba's transcendental functions can differ from
+    numpy's in the last place, so they aren't bit-for-bit identical: the spherical excesses of cells agree to within
+    SPHERICAL_EXCESS_TOLERANCE (a few units in the last place of 2 pi), i.e. about 0.2 m2 on the Earth.
+    """
+    global _backend
+    if name == 'auto':
+        name = available_backends()[-1]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (expected one of {', '.join(['auto', *BACKENDS])})")
+    if name not in available_backends():
+        raise ImportError(f"The {name} backend is not available because {name} is not installed")
+    _backend = name
+
+
+try:
+    set_backend(os.environ.get('GRIDSPEC_BACKEND', 'numpy'))
+except (ImportError, ValueError) as e:
+    warnings.warn(f"{e}; using the numpy backend")
+    set_backend('numpy')
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _xyz(lat, lon, degrees):
+        if degrees:
+            lat = lat * (np.pi / 180.)
+            lon = lon * (np.pi / 180.)
+        c = np.cos(lat)
+        return np.cos(lon) * c, np.sin(lon) * c, np.sin(lat)
+
+    @numba.njit(cache=True)
+    def _cross(a, b):
+        return a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2], a[0]*b[1] - a[1]*b[0]
+
+    @numba.njit(cache=True)
+    def _dot(a, b):
+        return a[0]*b[0] + a[1]*b[1] + a[2]*b[2]
+
+    @numba.njit(cache=True)
+    def _angle(e1, e2, n1, n2):
+        return np.arccos(-_dot(e2, e1) / np.sqrt(n2 * n1))
+
+    @numba.njit(cache=True, nogil=True)
+    def quadrilateral_area_2d(lat_ll, lon_ll, lat_ul, lon_ul, lat_ur, lon_ur, lat_lr, lon_lr, radius, degrees, out):
+        """ Numba version of geometry.quadrilateral_area for 2D arrays. It evaluates the same expressions in the same
+        order, one cell at a time.
+        """
+        for i in range(out.shape[0]):
+            for j in range(out.shape[1]):
+                ll = _xyz(lat_ll[i, j], lon_ll[i, j], degrees)
+                lr = _xyz(lat_lr[i, j], lon_lr[i, j], degrees)
+                ur = _xyz(lat_ur[i, j], lon_ur[i, j], degrees)
+                ul = _xyz(lat_ul[i, j], lon_ul[i, j], degrees)
+                e0 = _cross(ll, lr)
+                e1 = _cross(lr, ur)
+                e2 = _cross(ur, ul)
+                e3 = _cross(ul, ll)
+                n0 = _dot(e0, e0)
+                n1 = _dot(e1, e1)
+                n2 = _dot(e2, e2)
+                n3 = _dot(e3, e3)
+                a1 = _angle(e3, e0, n3, n0)
+                a2 = _angle(e0, e1, n0, n1)
+                a3 = _angle(e1, e2, n1, n2)
+                a4 = _angle(e2, e3, n2, n3)
+                out[i, j] = (a1 + a2 + a3 + a4 - 2.*np.pi) * radius * radius
+        return out
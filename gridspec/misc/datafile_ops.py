@@ -1,16 +1,96 @@
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
+import netCDF4
+import numpy as np
 import xarray as xr
 
-from gridspec.base import load_mosaic
+from gridspec.base import GridspecMosaic, load_mosaic
+from gridspec.misc.encoding import EncodingPolicy
 
 
-def split_datafile(datafile, tile_dim, gridspec_file, directory=None) -> List[str]:
-    mosaic = load_mosaic(gridspec_file)
-    ds = xr.open_dataset(datafile)
+# the maximum size of the blocks that data files are copied in
+COPY_BLOCK_BYTES = 64 * 1024**2
+
+
+def copy_blocks(shape, itemsize, max_bytes=COPY_BLOCK_BYTES):
+    """ Yields index tuples (of slices) that split an array into blocks of at most max_bytes (or a single element of
+    the innermost axis, if that's bigger). Blocks are ranges along one axis, and whole along the axes after it.
+    """
+    axis = len(shape)
+    block_bytes = itemsize
+    while axis > 0 and block_bytes * shape[axis - 1] <= max_bytes:
+        axis -= 1
+        block_bytes *= shape[axis]
+    if axis == 0:
+        yield tuple(slice(None) for _ in shape)
+        return
+    step = max(1, max_bytes // block_bytes)
+    whole = tuple(slice(None) for _ in shape[axis:])
+    for outer in np.ndindex(*shape[:axis - 1]):
+        outer = tuple(slice(i, i + 1) for i in outer)
+        for start in range(0, shape[axis - 1], step):
+            yield (*outer, slice(start, min(start + step, shape[axis - 1])), *whole)
+
+
+def _itemsize(var) -> int:
+    """ Returns the size of a variable's elements. netCDF4 reports the type of variable-length strings as str, so their
+    size is estimated as that of an object pointer.
+    """
+    return var.dtype.itemsize if isinstance(var.dtype, np.dtype) else np.dtype(object).itemsize
+
+
+def _coordinate_names(ds) -> set:
+    """ Returns the names of the coordinate variables of a netCDF4.Dataset: dimension coordinates, and the
+    variables that are named by coordinates or bounds attributes.
+    """
+    names = set(ds.dimensions)
+    for var in ds.variables.values():
+        if 'coordinates' in var.ncattrs():
+            names.update(var.getncattr('coordinates').split())
+        if 'bounds' in var.ncattrs():
+            names.add(var.getncattr('bounds'))
+    return names
 
-    assert ds.dims[tile_dim] == len(mosaic.tiles)
+
+def _create_variable_like(ds, var, dims, chunksizes, name=None, encoding=None, lossy=False):
+    """ Creates a variable in ds with var's type and attributes. In netCDF4 files, it also has var's filters, and
+    chunksizes (contiguous if None), unless an EncodingPolicy is given (lossy says if it may quantize the variable).
+    """
+    kwargs = {}
+    if ds.data_model.startswith('NETCDF4') and encoding is not None:
+        shape = [ds.dimensions[dim].size for dim in dims]
+        unlimited = any(ds.dimensions[dim].isunlimited() for dim in dims)
+        kwargs = encoding.variable_kwargs(shape, var.dtype, lossy=lossy, unlimited=unlimited)
+    # scalars can't be chunked, so they can't be compressed either
+    elif ds.data_model.startswith('NETCDF4') and len(dims) > 0:
+        filters = var.filters()
+        kwargs.update({k: filters[k] for k in ['zlib', 'complevel', 'shuffle', 'fletcher32'] if k in filters})
+        if chunksizes is None:
+            kwargs['contiguous'] = True
+        else:
+            kwargs['chunksizes'] = chunksizes
+    attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+    new_var = ds.createVariable(
+        var.name if name is None else name, var.datatype, dims, fill_value=attrs.pop('_FillValue', None), **kwargs
+    )
+    new_var.setncatts(attrs)
+    return new_var
+
+
+def split_datafile(datafile, tile_dim, gridspec_file, directory=None, max_block_bytes=COPY_BLOCK_BYTES,
+                   encoding=None) -> List[str]:
+    """ Splits a data file with a tile dimension into one file per tile of a mosaic.
+
+    gridspec_file is the mosaic file, or a loaded GridspecMosaic. Only the mosaic file is read (not the tile files).
+    The variables are copied as stored (no decoding) in blocks of at most max_block_bytes, which are read once for all
+    tiles, so memory use does not depend on the file size. The tile dimension's coordinate becomes a scalar coordinate
+    in each file. The variables keep their compression and chunking, unless encoding (an EncodingPolicy) is given.
+    """
+    if isinstance(gridspec_file, GridspecMosaic):
+        mosaic = gridspec_file
+    else:
+        mosaic = load_mosaic(gridspec_file, load_tiles=False)
 
     # Determine the output directory for the split files
     datafile_path = Path(datafile)
@@ -19,28 +99,86 @@ def split_datafile(datafile, tile_dim, gridspec_file, directory=None) -> List[st
         directory = parent_dir
     directory = Path(directory)
 
-    # Split the files
-    split_file_paths=[]
-    for i, tile_name in enumerate(mosaic.tile_names):
-        tile_ds = ds.isel(**{tile_dim: i})
-        filename = f"{datafile_path.stem}.{tile_name}.nc"
-        opath = str(directory.joinpath(filename))
-        tile_ds.to_netcdf(opath)
-        split_file_paths.append(opath)
+    split_file_paths = [
+        str(directory.joinpath(f"{datafile_path.stem}.{tile_name}.nc")) for tile_name in mosaic.tile_names
+    ]
+    with netCDF4.Dataset(datafile) as src:
+        if src.dimensions[tile_dim].size != len(mosaic.tile_names):
+            raise ValueError(
+                f"{datafile} has {src.dimensions[tile_dim].size} {tile_dim} but the mosaic has "
+                f"{len(mosaic.tile_names)} tiles"
+            )
+        outputs = [netCDF4.Dataset(path, 'w', format=src.data_model) for path in split_file_paths]
+        try:
+            for ds in [src, *outputs]:
+                ds.set_auto_maskandscale(False)
+                ds.set_auto_chartostring(False)
+            for dst in outputs:
+                dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+                for dim in src.dimensions.values():
+                    if dim.name != tile_dim:
+                        dst.createDimension(dim.name, None if dim.isunlimited() else dim.size)
+
+            coord_names = _coordinate_names(src)
+            for var in src.variables.values():
+                dims = tuple(dim for dim in var.dimensions if dim != tile_dim)
+                chunking = var.chunking()
+                chunksizes = None if chunking == 'contiguous' else [
+                    size for dim, size in zip(var.dimensions, chunking) if dim != tile_dim
+                ]
+                dst_vars = [
+                    _create_variable_like(
+                        dst, var, dims, chunksizes, encoding=encoding, lossy=var.name not in coord_names
+                    ) for dst in outputs
+                ]
+                if tile_dim not in var.dimensions:
+                    for key in copy_blocks(var.shape, _itemsize(var), max_block_bytes):
+                        data = var[key]
+                        for dst_var in dst_vars:
+                            dst_var[key] = data
+                    continue
+                if var.name != tile_dim and tile_dim in src.variables:
+                    coordinates = [*var.getncattr('coordinates').split(), tile_dim] \
+                        if 'coordinates' in var.ncattrs() else [tile_dim]
+                    for dst_var in dst_vars:
+                        dst_var.setncattr('coordinates', ' '.join(coordinates))
+                tile_axis = var.dimensions.index(tile_dim)
+                shape = [size for dim, size in zip(var.dimensions, var.shape) if dim != tile_dim]
+                for key in copy_blocks(shape, _itemsize(var) * len(outputs), max_block_bytes):
+                    data = var[(*key[:tile_axis], slice(None), *key[tile_axis:])]
+                    for i, dst_var in enumerate(dst_vars):
+                        dst_var[key] = np.take(data, i, axis=tile_axis)
+        finally:
+            for dst in outputs:
+                dst.close()
     return split_file_paths
 
 
+def load_tile_centers(gridspec_file) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """ Returns the (name, center latitudes, center longitudes) of each tile of a mosaic """
+    mosaic = load_mosaic(gridspec_file)
+    return [
+        (tile.name, np.ascontiguousarray(tile.supergrid_lats[1::2, 1::2]),
+         np.ascontiguousarray(tile.supergrid_lons[1::2, 1::2]))
+        for tile in mosaic.tiles
+    ]
+
+
 def touch_datafiles(gridspec_file, datafile_prefix, datafile_suffix='.nc', directory="./",
                     name_dim1='Ydim', name_dim2='Xdim',
-                    name_lat_coord='lats', name_lon_coord='lons') -> List[str]:
-    mosaic = load_mosaic(gridspec_file)
+                    name_lat_coord='lats', name_lon_coord='lons', tile_centers=None, encoding=None) -> List[str]:
+    """ Creates a data file for each tile of a mosaic with only the grid-box center coordinates. To touch many sets
+    of files, get tile_centers from load_tile_centers() once (then gridspec_file is not used). encoding is an
+    EncodingPolicy.
+    """
+    if encoding is None:
+        encoding = EncodingPolicy()
+    if tile_centers is None:
+        tile_centers = load_tile_centers(gridspec_file)
     directory = Path(directory)
 
     new_files=[]
-    for tile in mosaic.tiles:
-        lons = tile.supergrid_lons[1::2, 1::2]
-        lats = tile.supergrid_lats[1::2, 1::2]
-
+    for tile_name, lats, lons in tile_centers:
         ds = xr.Dataset()
         ds.coords[name_lon_coord] = xr.DataArray(
             lons,
@@ -59,17 +197,29 @@ def touch_datafiles(gridspec_file, datafile_prefix, datafile_suffix='.nc', direc
             )
         )
 
-        filename = f"{datafile_prefix}.{tile.name}{datafile_suffix}"
+        filename = f"{datafile_prefix}.{tile_name}{datafile_suffix}"
         opath = str(directory.joinpath(filename))
-        ds.to_netcdf(opath)
+        ds.to_netcdf(opath, encoding=encoding.encoding(ds))
         new_files.append(opath)
     return new_files
 
 
 def join_datafiles(datafile_prefix, gridspec_file, tile_dim,
                    datafile_suffix='.nc', directory="./",
-                   rename_dict=None, coord_attrs_dict=None, transpose=None) -> str:
-    mosaic = load_mosaic(gridspec_file, load_tiles=False)
+                   rename_dict=None, coord_attrs_dict=None, transpose=None,
+                   max_block_bytes=COPY_BLOCK_BYTES, encoding=None) -> str:
+    """ Joins the data files of a mosaic's tiles into one file with a tile dimension (the reverse of split_datafile).
+
+    The output file is created with its final names and dimension order (rename_dict and transpose), and each tile's
+    variables are copied as stored (no decoding) into their hyperslabs, in blocks of at most max_block_bytes. Like
+    xr.concat, data variables are stacked along tile_dim, other coordinates are stacked only if they differ between
+    the tiles, and index coordinates are taken from the first tile. The variables keep their compression and (tile)
+    chunking, unless encoding (an EncodingPolicy) is given.
+    """
+    if isinstance(gridspec_file, GridspecMosaic):
+        mosaic = gridspec_file
+    else:
+        mosaic = load_mosaic(gridspec_file, load_tiles=False)
     directory = Path(directory)
 
     if rename_dict is None:
@@ -77,21 +227,90 @@ def join_datafiles(datafile_prefix, gridspec_file, tile_dim,
     if coord_attrs_dict is None:
         coord_attrs_dict = {}
 
-    datasets = []
-    for tile_name in mosaic.tile_names:
-        filename = f"{datafile_prefix}.{tile_name}{datafile_suffix}"
-        filepath = directory.joinpath(filename)
-        datasets.append(xr.open_dataset(filepath))
+    def rename(name):
+        return rename_dict.get(name, name)
+
+    def ordered(dims):
+        # the dimension order after the transpose (which uses the new names)
+        if transpose is None:
+            return list(dims)
+        new_names = [rename(dim) for dim in dims]
+        order = [*[dim for dim in transpose if dim in new_names], *[dim for dim in new_names if dim not in transpose]]
+        return [dims[new_names.index(dim)] for dim in order]
+
+    tile_paths = [
+        directory.joinpath(f"{datafile_prefix}.{tile_name}{datafile_suffix}") for tile_name in mosaic.tile_names
+    ]
+    filepath = str(directory.joinpath(f"{datafile_prefix}{datafile_suffix}"))
+    tiles = [netCDF4.Dataset(path) for path in tile_paths]
+    try:
+        first = tiles[0]
+        if tile_dim in first.dimensions:
+            raise ValueError(f"{tile_paths[0]} already has a {tile_dim} dimension")
+        coord_names = set()
+        for var in first.variables.values():
+            coord_names.update(var.getncattr('coordinates').split() if 'coordinates' in var.ncattrs() else [])
+
+        data_coord_names = _coordinate_names(first)
+
+        def is_stacked(var):
+            if var.name == tile_dim:
+                return True
+            if var.dimensions == (var.name,):
+                return False
+            if var.name in coord_names:
+                values = var[...]
+                return not all(
+                    np.array_equal(values, tile.variables[var.name][...], equal_nan=values.dtype.kind == 'f')
+                    for tile in tiles[1:]
+                )
+            return True
 
-    ds = xr.concat(datasets, dim=tile_dim)
-    ds = ds.rename(rename_dict)
+        with netCDF4.Dataset(filepath, 'w', format=first.data_model) as dst:
+            for ds in [*tiles, dst]:
+                ds.set_auto_maskandscale(False)
+                ds.set_auto_chartostring(False)
+            dst.setncatts({k: first.getncattr(k) for k in first.ncattrs()})
+            dim_sizes = {tile_dim: len(tiles)}
+            for dim in first.dimensions.values():
+                dim_sizes[dim.name] = None if dim.isunlimited() else dim.size
+            for dim in ordered(list(dim_sizes)):
+                dst.createDimension(rename(dim), dim_sizes[dim])
 
-    for c, a in coord_attrs_dict.items():
-        ds.coords[c].attrs.update(a)
-    if transpose is not None:
-        ds = ds.transpose(*transpose)
+            for var in first.variables.values():
+                stacked = is_stacked(var)
+                in_dims = (tile_dim, *var.dimensions) if stacked else var.dimensions
+                out_dims = ordered(in_dims)
+                chunking = var.chunking()
+                if chunking == 'contiguous':
+                    chunksizes = None
+                else:
+                    chunk_sizes = {tile_dim: 1, **dict(zip(var.dimensions, chunking))}
+                    chunksizes = [chunk_sizes[dim] for dim in out_dims]
+                dst_var = _create_variable_like(
+                    dst, var, [rename(dim) for dim in out_dims], chunksizes, name=rename(var.name),
+                    encoding=encoding, lossy=var.name not in data_coord_names
+                )
+                if 'coordinates' in var.ncattrs():
+                    coordinates = [rename(name) for name in var.getncattr('coordinates').split() if name != tile_dim]
+                    if coordinates:
+                        dst_var.setncattr('coordinates', ' '.join(coordinates))
+                    else:
+                        dst_var.delncattr('coordinates')
+                dst_var.setncatts(coord_attrs_dict.get(rename(var.name), {}))
 
-    filename = f"{datafile_prefix}{datafile_suffix}"
-    filepath = str(directory.joinpath(filename))
-    ds.to_netcdf(filepath)
+                perm = [in_dims.index(dim) for dim in out_dims]
+                sources = [(tile.variables[var.name], slice(i, i + 1)) for i, tile in enumerate(tiles)] \
+                    if stacked else [(var, None)]
+                for src_var, tile_key in sources:
+                    for key in copy_blocks(src_var.shape, _itemsize(src_var), max_block_bytes):
+                        data = np.asarray(src_var[key])
+                        dst_key = dict(zip(var.dimensions, key))
+                        if stacked:
+                            data = data[np.newaxis]
+                            dst_key[tile_dim] = tile_key
+                        dst_var[tuple(dst_key[dim] for dim in out_dims)] = np.transpose(data, perm)
+    finally:
+        for tile in tiles:
+            tile.close()
     return filepath
@@ -0,0 +1,112 @@
+import numpy as np
+
+# the default maximum size of a chunk
+CHUNK_BYTES = 4 * 1024**2
+
+
+def chunk_shape(shape, itemsize, max_bytes=CHUNK_BYTES) -> tuple:
+    """ Returns a chunk shape for tile-wise access: one element along the leading axes, and whole rows of the last two
+    axes (a horizontal slab), with as many rows as fit in max_bytes.
+    """
+    shape = [max(1, size) for size in shape]
+    if len(shape) == 1:
+        return (min(shape[0], max(1, max_bytes // itemsize)),)
+    row_bytes = itemsize * shape[-1]
+    rows = min(shape[-2], max(1, max_bytes // row_bytes))
+    return (*[1 for _ in shape[:-2]], rows, shape[-1])
+
+
+def zarr_v3() -> bool:
+    """ Returns True if zarr 3 (or later) is installed. Its arrays take a list of compressors (codecs) and dimension
+    names, while zarr 2 arrays take one (numcodecs) compressor, and xarray keeps their dimensions in an attribute.
+    """
+    import zarr
+    return int(zarr.__version__.split('.')[0]) >= 3
+
+
+class EncodingPolicy:
+    """ How variables are encoded in the NetCDF files that are written.
+
+    complevel is the zlib compression level (0 is uncompressed), and shuffle enables the byte shuffle filter.
+    Compressed variables are chunked by chunk_shape with chunks of at most chunk_bytes. If float32_area is True, cell
+    areas are stored as float32. If significant_digits is set, the floating-point data variables of data files (not
+    coordinates) are quantized to that many significant digits, which makes them compress much better (lossy).
+
+    Grid coordinates are never stored with reduced precision, so stored areas can still be checked against the grid
+    (see LogicallyRectangularGrid.set_stored_area).
+    """
+    def __init__(self, complevel=0, shuffle=True, chunk_bytes=CHUNK_BYTES, float32_area=False, significant_digits=None):
+        if not 0 <= complevel <= 9:
+            raise ValueError(f"Invalid compression level: {complevel} (expected 0 to 9)")
+        self.complevel = complevel
+        self.shuffle = shuffle
+        self.chunk_bytes = chunk_bytes
+        self.float32_area = float32_area
+        self.significant_digits = significant_digits
+
+    def __eq__(self, other):
+        return isinstance(other, EncodingPolicy) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"EncodingPolicy({', '.join(f'{k}={v!r}' for k, v in vars(self).items())})"
+
+    def variable_kwargs(self, shape, dtype, lossy=False, unlimited=False) -> dict:
+        """ Returns the netCDF4.Dataset.createVariable keyword arguments (which are also valid xarray encodings) for a
+        variable. Variables with unlimited dimensions are always chunked.
+        """
+        dtype = np.dtype(dtype)
+        if len(shape) == 0 or dtype.kind not in 'biuf':
+            return {}
+        kwargs = dict(zlib=self.complevel > 0)
+        if self.complevel > 0 or unlimited:
+            kwargs['chunksizes'] = chunk_shape(shape, dtype.itemsize, self.chunk_bytes)
+        else:
+            kwargs['contiguous'] = True
+        if self.complevel > 0:
+            kwargs.update(complevel=self.complevel, shuffle=self.shuffle)
+        if lossy and self.significant_digits is not None and dtype.kind == 'f':
+            kwargs['significant_digits'] = self.significant_digits
+        return kwargs
+
+    def zarr_array_kwargs(self, shape, dtype) -> dict:
+        """ Returns the keyword arguments of zarr's array creation (which are also valid xarray encodings) for an array.
+        The compressor is Blosc with zlib (and byte shuffle), and quantization is not applied.
+        """
+        dtype = np.dtype(dtype)
+        if len(shape) == 0 or dtype.kind not in 'biuf':
+            return {}
+        kwargs = dict(chunks=chunk_shape(shape, dtype.itemsize, self.chunk_bytes))
+        if zarr_v3():
+            from zarr.codecs import BloscCodec
+            shuffle = 'shuffle' if self.shuffle else 'noshuffle'
+            kwargs['compressors'] = [BloscCodec(cname='zlib', clevel=self.complevel, shuffle=shuffle)] \
+                if self.complevel > 0 else None
+        else:
+            from numcodecs import Blosc
+            shuffle = Blosc.SHUFFLE if self.shuffle else Blosc.NOSHUFFLE
+            kwargs['compressor'] = Blosc(cname='zlib', clevel=self.complevel, shuffle=shuffle) \
+                if self.complevel > 0 else None
+        return kwargs
+
+    def area_dtype(self, dtype='f8') -> np.dtype:
+        return np.dtype('f4') if self.float32_area else np.dtype(dtype)
+
+    def encoding(self, ds, area=(), lossy=()) -> dict:
+        """ Returns the encoding argument of xr.Dataset.to_netcdf for ds. area are the names of cell area variables,
+        and lossy the names of the variables that may be quantized.
+        """
+        encoding = {}
+        for name, var in ds.variables.items():
+            encoding[name] = self.variable_kwargs(var.shape, var.dtype, lossy=name in lossy)
+            if name in area and encoding[name]:
+                encoding[name]['dtype'] = self.area_dtype(var.dtype)
+        return encoding
+
+    def zarr_encoding(self, ds, area=()) -> dict:
+        """ Returns the encoding argument of xr.Dataset.to_zarr for ds (see encoding) """
+        encoding = {}
+        for name, var in ds.variables.items():
+            encoding[name] = self.zarr_array_kwargs(var.shape, var.dtype)
+            if name in area and encoding[name]:
+                encoding[name]['dtype'] = self.area_dtype(var.dtype)
+        return encoding
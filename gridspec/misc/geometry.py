@@ -1,5 +1,7 @@
 import numpy as np
 
+from gridspec.misc import backend
+
 
 def sph2cart(pl, degrees=False):
     if degrees:
@@ -42,26 +44,149 @@ def spherical_angle(v1, v2, v3):
 
 
 def spherical_excess_area(ll, ul, ur, lr, radius=6371000.):
-    v1 = sph2cart(ll)
-    v2 = sph2cart(lr)
-    v3 = sph2cart(ul)
-    a1 = spherical_angle(v1, v2, v3)
-
-    v1 = sph2cart(lr)
-    v2 = sph2cart(ur)
-    v3 = sph2cart(ll)
-    a2 = spherical_angle(v1, v2, v3)
-
-    v1 = sph2cart(ur)
-    v2 = sph2cart(ul)
-    v3 = sph2cart(lr)
-    a3 = spherical_angle(v1, v2, v3)
-
-    v1 = sph2cart(ul)
-    v2 = sph2cart(ur)
-    v3 = sph2cart(ll)
-    a4 = spherical_angle(v1, v2, v3)
-
-    area = (a1 + a2 + a3 + a4 - 2.*np.pi) * radius * radius
-    return area
-
+    corners = [(pt[..., 0], pt[..., 1]) for pt in (ll, ul, ur, lr)]
+    return quadrilateral_area(*corners, radius=radius)
+
+
+def great_circle_midpoint(lat1, lon1, lat2, lon2):
+    """ Returns the latitudes and longitudes (in degrees) of the midpoints of the great circle arcs between two sets
+    of points. The longitudes are on the same branch as lon1.
+    """
+    lat1, lon1, lat2, lon2 = (np.deg2rad(a) for a in (lat1, lon1, lat2, lon2))
+    cos_lat1 = np.cos(lat1)
+    cos_lat2 = np.cos(lat2)
+    x = cos_lat1 * np.cos(lon1) + cos_lat2 * np.cos(lon2)
+    y = cos_lat1 * np.sin(lon1) + cos_lat2 * np.sin(lon2)
+    z = np.sin(lat1) + np.sin(lat2)
+    lat = np.rad2deg(np.arctan2(z, np.hypot(x, y)))
+    lon = np.rad2deg(np.arctan2(y, x))
+    lon1 = np.rad2deg(lon1)
+    lon = lon1 + (lon - lon1 + 180) % 360 - 180
+    return lat, lon
+
+
+def latlon_cell_area(lat_bnds, lon_bnds, radius=6371000.):
+    """ Returns the areas of the cells of a regular lat-lon grid, i.e., cells bounded by meridians and circles of
+    latitude, from their (n, 2) latitude and longitude bounds in degrees. The area of a cell is
+    R^2 (lon2 - lon1) (sin(lat2) - sin(lat1)).
+
+    The longitude bounds may run eastward or westward (in the direction of most cells), and cells may cross the
+    0/360 (or +-180) meridian.
+    """
+    dsin_lat = np.abs(np.sin(np.deg2rad(lat_bnds[:, 1])) - np.sin(np.deg2rad(lat_bnds[:, 0])))
+    dlon = np.asarray(lon_bnds[:, 1] - lon_bnds[:, 0], dtype=float)
+    if np.count_nonzero(dlon < 0) > dlon.size / 2:
+        dlon = -dlon
+    # widths modulo 360, except that cells spanning all longitudes are 360 wide
+    dlon = np.where(np.mod(dlon, 360) == 0, np.abs(dlon), np.mod(dlon, 360))
+    return np.outer(dsin_lat * radius * radius, np.deg2rad(dlon))
+
+
+# number of corner-shaped arrays in a quadrilateral_area workspace
+_QUAD_WORKSPACE_SIZE = 26
+
+
+def quadrilateral_workspace(shape) -> np.ndarray:
+    """ Returns a workspace for quadrilateral_area with corners of the given shape """
+    return np.empty((_QUAD_WORKSPACE_SIZE, *shape))
+
+
+def _latlon_to_xyz(lat, lon, out):
+    np.cos(lat, out=out[2])
+    np.cos(lon, out=out[0])
+    out[0] *= out[2]
+    np.sin(lon, out=out[1])
+    out[1] *= out[2]
+    np.sin(lat, out=out[2])
+
+
+def _cross(a, b, out, tmp):
+    for i, j, k in [(0, 1, 2), (1, 2, 0), (2, 0, 1)]:
+        np.multiply(a[j], b[k], out=out[i])
+        np.multiply(a[k], b[j], out=tmp)
+        out[i] -= tmp
+
+
+def _dot(a, b, out, tmp):
+    np.multiply(a[0], b[0], out=out)
+    for i in [1, 2]:
+        np.multiply(a[i], b[i], out=tmp)
+        out += tmp
+
+
+def _angle(e1, e2, n1, n2, out, tmp):
+    # the interior angle between edges e1 = v0 x v1 and e2 = v1 x v2 at vertex v1 (n1, n2 are their squared norms)
+    _dot(e2, e1, out, tmp)
+    np.negative(out, out=out)
+    np.multiply(n2, n1, out=tmp)
+    np.sqrt(tmp, out=tmp)
+    out /= tmp
+    np.arccos(out, out=out)
+
+
+def quadrilateral_area(ll, ul, ur, lr, radius=6371000., degrees=False, out=None, workspace=None):
+    """ Returns the areas of spherical quadrilaterals (by spherical excess).
+
+    Each corner is a (lat, lon) pair of arrays (they can be any views, e.g. strided slices of a supergrid). The
+    corners are converted to cartesian coordinates once each, and every temporary lives in workspace (see
+    quadrilateral_workspace), so with out and workspace given this allocates nothing. With the numba backend (see
+    gridspec.misc.backend) a compiled kernel is used instead, and workspace is not needed.
+    """
+    shape = np.broadcast(*ll, *ul, *ur, *lr).shape
+    if out is None:
+        out = np.empty(shape)
+    if backend.get_backend() == 'numba':
+        return _quadrilateral_area_numba(ll, ul, ur, lr, radius, degrees, out)
+    if workspace is None:
+        workspace = quadrilateral_workspace(shape)
+    ws = [workspace[i, ...] for i in range(_QUAD_WORKSPACE_SIZE)]
+    lat, lon, tmp, a3, a4 = ws[:5]
+    n0, n_bufs = ws[5], ws[6:8]
+    c0, c_bufs = ws[8:11], [ws[11:14], ws[14:17]]
+    e0, e_bufs = ws[17:20], [ws[20:23], ws[23:26]]
+
+    def to_xyz(corner, xyz):
+        if degrees:
+            np.deg2rad(corner[0], out=lat)
+            np.deg2rad(corner[1], out=lon)
+            _latlon_to_xyz(lat, lon, xyz)
+        else:
+            _latlon_to_xyz(*corner, xyz)
+
+    # walk around the quadrilateral; edge k goes from corner k to corner k+1, and the angle at corner k is between
+    # edges k-1 and k
+    to_xyz(ll, c0)
+    c_prev, e_prev, n_prev = c0, None, None
+    for k, corner in enumerate([lr, ur, ul, None]):
+        if corner is None:
+            c_next = c0
+        else:
+            c_next = c_bufs[k % 2]
+            to_xyz(corner, c_next)
+        e, n = (e0, n0) if k == 0 else (e_bufs[k % 2], n_bufs[k % 2])
+        _cross(c_prev, c_next, e, tmp)
+        _dot(e, e, n, tmp)
+        if k > 0:
+            _angle(e_prev, e, n_prev, n, [None, out, a3, a4][k], tmp)
+        c_prev, e_prev, n_prev = c_next, e, n
+    _angle(e_prev, e0, n_prev, n0, lat, tmp)
+
+    # (a1 + a2 + a3 + a4 - 2 pi) R^2, in the same order as a scalar evaluation
+    np.add(lat, out, out=out)
+    out += a3
+    out += a4
+    out -= 2.*np.pi
+    out *= radius
+    out *= radius
+    return out if out.ndim else out[()]
+
+
+def _quadrilateral_area_numba(ll, ul, ur, lr, radius, degrees, out):
+    arrays = np.broadcast_arrays(*ll, *ul, *ur, *lr, out)
+    if out.ndim == 2:
+        backend.quadrilateral_area_2d(*arrays[:-1], radius, degrees, out)
+    else:
+        # the kernel works on 2D arrays; other shapes are flattened (copied, if necessary)
+        arrays = [a.reshape(1, -1) for a in arrays[:-1]]
+        out[...] = backend.quadrilateral_area_2d(*arrays, radius, degrees, np.empty(arrays[0].shape)).reshape(out.shape)
+    return out if out.ndim else out[()]
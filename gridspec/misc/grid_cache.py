@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import List, Optional
+
+import gridspec
+
+_MANIFEST = 'manifest.json'
+
+
+class GridFileCache:
+    """ A persistent, content-addressed cache of generated grid files.
+
+    Each entry is a directory named by the hash of the grid's canonical generation parameters and the package version.
+    It holds the grid's files (e.g. a mosaic and its tiles) and a manifest listing them in order. The total size of the
+    cache is kept under max_bytes by evicting the least recently used entries.
+
+    Fetched files are hard-linked into the output directory when possible (and copied otherwise), so they share storage
+    with the cache. Use link=False to always copy.
+    """
+    def __init__(self, directory, max_bytes=10 * 1024**3, link=True):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.link = link
+
+    @staticmethod
+    def key(grid_type, **params) -> str:
+        canonical = json.dumps(
+            dict(grid_type=grid_type, params=params, version=gridspec.__version__),
+            sort_keys=True
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _entry(self, key) -> Path:
+        return self.directory.joinpath(key)
+
+    def fetch(self, key, directory) -> Optional[List[str]]:
+        """ Puts the cached files for key in directory and returns their paths, or None if key is not cached. """
+        entry = self._entry(key)
+        try:
+            with open(entry.joinpath(_MANIFEST)) as f:
+                filenames = json.load(f)
+        except FileNotFoundError:
+            return None
+        paths = []
+        try:
+            os.utime(entry)  # mark as recently used
+            for filename in filenames:
+                dst = Path(directory).joinpath(filename)
+                self._place(entry.joinpath(filename), dst)
+                paths.append(str(dst))
+        except FileNotFoundError:
+            # the entry was evicted by another process after its manifest was read
+            return None
+        return paths
+
+    def store(self, key, files) -> None:
+        """ Adds files (the first file's name is reported first by fetch) to the cache under key. """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self._entry(key)
+        if entry.exists():
+            return
+        tmp_entry = Path(tempfile.mkdtemp(dir=self.directory, prefix='.tmp-'))
+        try:
+            for file in files:
+                shutil.copy2(file, tmp_entry.joinpath(Path(file).name))
+            with open(tmp_entry.joinpath(_MANIFEST), 'w') as f:
+                json.dump([Path(file).name for file in files], f)
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            if not entry.exists():
+                raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None) -> None:
+        """ Removes least recently used entries (except keep) until the cache is no larger than max_bytes. """
+        entries = [entry for entry in self.directory.iterdir() if entry.is_dir() and not entry.name.startswith('.')]
+        sizes = {entry: sum(f.stat().st_size for f in entry.iterdir()) for entry in entries}
+        total = sum(sizes.values())
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+    def _place(self, src: Path, dst: Path):
+        if dst.exists() and dst.samefile(src):
+            return
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+        if self.link:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
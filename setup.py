@@ -18,6 +18,10 @@ setup(
         'numpy',
         'click',
     ],
+    extras_require={
+        'jit': ['numba'],
+        'zarr': ['zarr'],
+    },
     entry_points="""
         [console_scripts]
         gridspec-create=gridspec.cli:create
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from gridspec.gnom_cube_sphere.cubesphere import CSGrid, csgrid_GMAO, cartesian_to_latlon, vec_cartesian_to_latlon, \
+    rotate_sphere_3D, latlon_to_cartesian
+from gridspec.gnom_cube_sphere import supergrid_cache
+from gridspec.gnom_cube_sphere.supergrid_cache import SupergridCache
+
+
+def test_vec_cartesian_to_latlon_matches_scalar():
+    rng = np.random.default_rng(0)
+    xyz = rng.normal(size=(3, 500))
+    xyz[:, 0] = (0, 0, 1)  # pole
+    lon, lat = vec_cartesian_to_latlon(*xyz)
+    for k in range(xyz.shape[1]):
+        assert (lon[k], lat[k]) == cartesian_to_latlon(*xyz[:, k].copy())
+
+
+def test_csgrid_faces_match_pointwise_rotation():
+    c = 8
+    grid = CSGrid(c)
+    lon0 = np.deg2rad(grid.lon_edge[..., 0])
+    lat0 = np.deg2rad(grid.lat_edge[..., 0])
+    lon0[lon0 > np.pi] -= 2 * np.pi
+    for i, j in [(0, 0), (3, 5), (c, 2), (c, c)]:
+        # face 1 is face 0 rotated -90 degrees about z
+        x, y, _ = rotate_sphere_3D(lon0[i, j], lat0[i, j], 1., -np.pi / 2., 'z')
+        assert np.isclose(np.deg2rad(grid.lon_edge[i, j, 1]), x % (2 * np.pi), atol=1e-12)
+        assert np.isclose(np.deg2rad(grid.lat_edge[i, j, 1]), y, atol=1e-12)
+
+
+def test_csgrid_centers_are_normalized_corner_means():
+    grid = CSGrid(6)
+    lon = np.deg2rad(grid.lon_edge)
+    lat = np.deg2rad(grid.lat_edge)
+    for i, j, f in [(0, 0, 0), (2, 4, 3), (5, 5, 5)]:
+        corners = np.array([
+            latlon_to_cartesian(lon[i + di, j + dj, f], lat[i + di, j + dj, f])
+            for di, dj in [(0, 0), (1, 0), (1, 1), (0, 1)]
+        ])
+        mid = corners.sum(axis=0)
+        mid /= np.linalg.norm(mid)
+        assert np.allclose(grid.xyz_center[:, i, j, f], mid)
+
+
+def test_csgrid_gmao_tile_centers():
+    grid = csgrid_GMAO(24)
+    lat_b = grid['lat_b']
+    lon_b = grid['lon_b']
+    expected = [(0, 350), (0, 80), (90, None), (0, 170), (0, 260), (-90, None)]
+    for tile, (lat, lon) in enumerate(expected):
+        assert np.isclose(lat_b[tile, 12, 12], lat, atol=1e-9)
+        if lon is not None:
+            assert np.isclose(lon_b[tile, 12, 12], lon, atol=1e-9)
+
+
+def test_csgrid_gmao_edges_only():
+    full = csgrid_GMAO(12)
+    edges = csgrid_GMAO(12, edges_only=True)
+    assert set(edges) == {'lon_b', 'lat_b'}
+    assert np.array_equal(full['lon_b'], edges['lon_b'])
+    assert np.array_equal(full['lat_b'], edges['lat_b'])
+    assert CSGrid(12, edges_only=True).xyz_center is None
+
+
+def test_csgrid_analytic_matches_reflection():
+    reflection = csgrid_GMAO(24, method='reflection')
+    analytic = csgrid_GMAO(24, method='analytic')
+    for name in ['lon_b', 'lat_b']:
+        assert np.allclose(reflection[name], analytic[name], rtol=0, atol=1e-10)
+    for name in ['lon', 'lat']:
+        assert np.allclose(reflection[name], analytic[name], rtol=0, atol=1e-10)
+
+
+def test_supergrid_cache(tmp_path):
+    cache = SupergridCache(max_bytes=3 * 2 * 6 * 9 * 9 * 8, directory=tmp_path)
+    lat_b, lon_b = cache.get(8, 0)
+    expected = csgrid_GMAO(8, 0, edges_only=True)
+    assert np.array_equal(lat_b, expected['lat_b'])
+    assert np.array_equal(lon_b, expected['lon_b'])
+
+    lat_b[:] = 0  # returned arrays are copies
+    assert np.array_equal(cache.get(8, 0)[0], expected['lat_b'])
+
+    for offset in [1, 2, 3]:
+        cache.get(8, offset)
+    assert cache.nbytes <= cache.max_bytes
+    assert (8, 0., None) not in cache._entries  # least recently used was evicted
+
+    # reloaded from disk by a new cache
+    assert np.array_equal(SupergridCache(directory=tmp_path).get(8, 0)[1], expected['lon_b'])
+
+
+def test_supergrid_cache_disabled(monkeypatch):
+    supergrids = []
+
+    def recording_csgrid_GMAO(*args, **kwargs):
+        supergrids.append(csgrid_GMAO(*args, **kwargs))
+        return supergrids[-1]
+
+    monkeypatch.setattr(supergrid_cache, 'csgrid_GMAO', recording_csgrid_GMAO)
+    cache = SupergridCache(max_bytes=0)
+    lat_b, lon_b = cache.get(8, 0)
+    assert cache.nbytes == 0
+    # not copied, since nothing else holds them
+    assert lat_b is supergrids[0]['lat_b'] and lon_b is supergrids[0]['lon_b']
+    assert lat_b.flags.writeable
+    assert supergrid_cache.default_cache.max_bytes == 0
+
+
+def test_supergrid_cache_size_env(monkeypatch):
+    monkeypatch.setenv('GRIDSPEC_SUPERGRID_CACHE_SIZE', '64')
+    assert supergrid_cache._cache_size_from_env() == 64 * 1024**2
+    for value in ['64MB', '-1']:
+        monkeypatch.setenv('GRIDSPEC_SUPERGRID_CACHE_SIZE', value)
+        with pytest.warns(UserWarning, match='GRIDSPEC_SUPERGRID_CACHE_SIZE'):
+            assert supergrid_cache._cache_size_from_env() == 0
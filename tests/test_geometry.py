@@ -1,7 +1,13 @@
+import os
+import subprocess
+import sys
+
 import pytest
 
 import numpy as np
-from gridspec.misc.geometry import spherical_excess_area, sph2cart, cart2sph, spherical_angle
+from gridspec.misc import backend
+from gridspec.misc.geometry import latlon_cell_area, spherical_excess_area, sph2cart, cart2sph, spherical_angle, \
+    quadrilateral_area, quadrilateral_workspace
 
 
 def test_coordinate_transforms():
@@ -96,4 +102,81 @@ def test_area_calculation_single_cell():
     assert area == answer_m2
 
     area = spherical_excess_area(pt3, pt2, pt1, pt4, radius=RADIUS_EARTH)
-    assert area == answer_m2
\ No newline at end of file
+    assert area == answer_m2
+
+
+def test_latlon_cell_area_wrapped_bounds():
+    lat_bnds = np.array([[0., 1.]])
+    expected = latlon_cell_area(lat_bnds, np.array([[10., 11.], [11., 12.], [12., 13.]]))
+    for lon_bnds in [[[358.5, 359.5], [359.5, 0.5], [0.5, 1.5]], [[179.5, -179.5], [-179.5, -178.5], [-178.5, -177.5]],
+                     [[2.5, 1.5], [1.5, 0.5], [0.5, -0.5]], [[1.5, 0.5], [0.5, 359.5], [359.5, 358.5]]]:
+        assert np.allclose(latlon_cell_area(lat_bnds, np.array(lon_bnds)), expected, rtol=1e-12)
+    full = latlon_cell_area(np.array([[-90., 90.]]), np.array([[-180., 180.]]))
+    assert np.isclose(full[0, 0], 4 * np.pi * 6371000.**2, rtol=1e-12)
+
+
+def test_quadrilateral_area_matches_spherical_angles():
+    rng = np.random.default_rng(0)
+    lats = np.deg2rad(rng.uniform(-60, 60, size=(5, 7)))
+    lons = np.deg2rad(rng.uniform(0, 360, size=(5, 7)))
+    d = np.deg2rad(rng.uniform(0.1, 2, size=(5, 7)))
+    ll, ul, ur, lr = [np.stack([lats + dy, lons + dx], axis=-1) for dy, dx in [(0, 0), (d, 0), (d, d), (0, d)]]
+
+    v = [sph2cart(pt) for pt in (ll, ul, ur, lr)]
+    angles = [
+        spherical_angle(v[0], v[3], v[1]),
+        spherical_angle(v[3], v[2], v[0]),
+        spherical_angle(v[2], v[1], v[3]),
+        spherical_angle(v[1], v[2], v[0]),
+    ]
+    expected = (angles[0] + angles[1] + angles[2] + angles[3] - 2.*np.pi) * 6371000. * 6371000.
+    assert np.array_equal(spherical_excess_area(ll, ul, ur, lr), expected)
+
+    corners = [np.rad2deg((pt[..., 0], pt[..., 1])) for pt in (ll, ul, ur, lr)]
+    out = np.empty((5, 7))
+    workspace = quadrilateral_workspace((5, 7))
+    assert quadrilateral_area(*corners, degrees=True, out=out, workspace=workspace) is out
+    assert np.allclose(out, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize('name', backend.BACKENDS)
+def test_backends_agree(name, monkeypatch):
+    if name not in backend.available_backends():
+        with pytest.raises(ImportError):
+            backend.set_backend(name)
+        pytest.skip(f"{name} is not installed")
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(-80, 80, size=(6, 9))
+    lons = rng.uniform(0, 360, size=(6, 9))
+    d = 10**rng.uniform(-4, 0.7, size=(6, 9))
+    corners = [(lats + dy, lons + dx) for dy, dx in [(0, 0), (d, 0), (d, d), (0, d)]]
+    strided = [(lat[::2, 1::3], lon[::2, 1::3]) for lat, lon in corners]
+    single = np.deg2rad(np.array([(32.1, 43.2), (38.1, 42.1), (41.1, 52.1), (35.1, 49.9)]))
+
+    monkeypatch.setattr(backend, '_backend', 'numpy')
+    expected = [
+        quadrilateral_area(*corners, degrees=True),
+        quadrilateral_area(*strided, degrees=True),
+        spherical_excess_area(*single),
+    ]
+    monkeypatch.setattr(backend, '_backend', name)
+    actual = [
+        quadrilateral_area(*corners, degrees=True),
+        quadrilateral_area(*strided, degrees=True),
+        spherical_excess_area(*single),
+    ]
+    atol = backend.SPHERICAL_EXCESS_TOLERANCE * 6371000.**2
+    for a, e in zip(actual, expected):
+        assert np.shape(a) == np.shape(e)
+        assert np.allclose(a, e, rtol=0, atol=atol)
+
+
+def test_invalid_backend_env():
+    # an invalid GRIDSPEC_BACKEND warns on import and falls back to numpy
+    code = "import gridspec.misc.backend as backend; print(backend.get_backend())"
+    env = dict(os.environ, GRIDSPEC_BACKEND='nmupy')
+    result = subprocess.run([sys.executable, '-W', 'always', '-c', code], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0
+    assert result.stdout.strip() == 'numpy'
+    assert 'Unknown backend: nmupy' in result.stderr
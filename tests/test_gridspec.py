@@ -1,13 +1,23 @@
+import os
 from pathlib import Path
+import shutil
 
+import netCDF4
+import numpy as np
+import pytest
 import xarray as xr
 from click.testing import CliRunner
 
 import gridspec
 from gridspec.gnom_cube_sphere.gcs_gridspec import GridspecGnomonicCubedSphere
-from gridspec.base import load_mosaic
-from gridspec.misc.datafile_ops import split_datafile, join_datafiles, touch_datafiles
-from gridspec.cli import gcs, sgcs, latlon
+from gridspec.base import CFSingleTile, LazyArray, LogicallyRectangularGrid, consolidate_mosaic, load_mosaic, \
+    load_tile, open_zarr_dataset, split_mosaic
+from gridspec.misc.datafile_ops import copy_blocks, load_tile_centers, split_datafile, join_datafiles, \
+    touch_datafiles
+from gridspec.misc.encoding import EncodingPolicy, chunk_shape
+from gridspec.misc.grid_cache import GridFileCache
+from gridspec.latlon import GridspecRegularLatLon
+from gridspec.cli import gcs, sgcs, latlon, convert, dump, join, split, touch
 
 SAMPLE_C24_DATAFILE='GCHP.SpeciesConc.20180101_1200z.nc4'
 SAMPLE_C24_DATAFILE=Path(__file__).parent.joinpath(SAMPLE_C24_DATAFILE)
@@ -67,3 +77,548 @@ def test_cli_create_latlon(tmp_path):
     runner = CliRunner()
     result = runner.invoke(latlon, ['91', '180', '-o', f'{str(tmp_path)}'])
     assert result.exit_code == 0
+
+
+def test_cli_create_gcs_cached(tmp_path):
+    cache_dir = tmp_path.joinpath('cache')
+    runner = CliRunner()
+    for i in range(2):
+        output_dir = tmp_path.joinpath(f'out{i}')
+        output_dir.mkdir()
+        result = runner.invoke(gcs, ['6', '-o', str(output_dir), '--cache-dir', str(cache_dir)])
+        assert result.exit_code == 0
+        assert ('Using cached grid files' in result.output) == (i == 1)
+        assert load_mosaic(output_dir.joinpath('c6_gridspec.nc')).tiles[0].get_shape() == (13, 13)
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_grid_file_cache_eviction(tmp_path):
+    cache = GridFileCache(tmp_path.joinpath('cache'), max_bytes=150)
+    for i in range(3):
+        fpath = tmp_path.joinpath(f'grid{i}.nc')
+        fpath.write_bytes(b'x' * 100)
+        cache.store(cache.key('test', i=i), [fpath])
+    assert cache.fetch(cache.key('test', i=0), tmp_path) is None
+    assert cache.fetch(cache.key('test', i=2), tmp_path) == [str(tmp_path.joinpath('grid2.nc'))]
+
+
+def test_grid_file_cache_evicted_during_fetch(tmp_path, monkeypatch):
+    cache = GridFileCache(tmp_path.joinpath('cache'), link=False)
+    fpaths = []
+    for name in ['mosaic.nc', 'tile1.nc']:
+        fpaths.append(tmp_path.joinpath(name))
+        fpaths[-1].write_bytes(b'x' * 100)
+    key = cache.key('test')
+    cache.store(key, fpaths)
+    output_dir = tmp_path.joinpath('out')
+    output_dir.mkdir()
+    place = cache._place
+
+    def place_then_evict(src, dst):
+        # another process evicts the entry while it is being fetched
+        place(src, dst)
+        shutil.rmtree(cache.directory.joinpath(key))
+
+    monkeypatch.setattr(cache, '_place', place_then_evict)
+    assert cache.fetch(key, output_dir) is None
+
+
+def test_gridspec_streaming(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50)
+    mosaic.to_netcdf(directory=tmp_path)
+    streamed_dir = tmp_path.joinpath('streamed')
+    streamed_dir.mkdir()
+    streamed = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50, streaming=True)
+    fpath, _ = streamed.to_netcdf(directory=streamed_dir, block_rows=4)
+    mosaic2 = load_mosaic(fpath)
+    assert mosaic == mosaic2
+    for i, (t1, t2) in enumerate(zip(mosaic.tiles, mosaic2.tiles)):
+        assert t1 == t2
+        expected = xr.open_dataset(tmp_path.joinpath(f'c6_s2d00_ttj7d9v2fsmq4.tile{i+1}.nc'))
+        actual = xr.open_dataset(streamed_dir.joinpath(f'c6_s2d00_ttj7d9v2fsmq4.tile{i+1}.nc'))
+        assert actual.area.dims == expected.area.dims
+        assert np.allclose(actual.area, expected.area)
+        assert actual.area.attrs['grid_checksum'] == mosaic2.tiles[i].grid_checksum()
+
+
+def test_gridspec_parallel_write(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    for processes in [False, True]:
+        directory = tmp_path.joinpath(f'processes_{processes}')
+        directory.mkdir()
+        fpath, tile_paths = mosaic.to_netcdf(directory=directory, workers=3, processes=processes)
+        assert len(tile_paths) == 6
+        mosaic2 = load_mosaic(fpath)
+        for t1, t2 in zip(mosaic.tiles, mosaic2.tiles):
+            assert t1 == t2
+
+
+def test_gridspec_parallel_load(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    fpath, _ = mosaic.to_netcdf(directory=tmp_path)
+    for processes in [False, True]:
+        mosaic2 = load_mosaic(fpath, workers=3, processes=processes)
+        assert [t.name for t in mosaic2.tiles] == [t.name for t in mosaic.tiles]
+        for t1, t2 in zip(mosaic.tiles, mosaic2.tiles):
+            assert t1 == t2
+
+
+def test_gridspec_parallel_load_uses_processes(tmp_path, monkeypatch):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    fpath, _ = mosaic.to_netcdf(directory=tmp_path)
+    executors = []
+
+    class RecordingProcessPoolExecutor(gridspec.base.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            executors.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(gridspec.base, 'ProcessPoolExecutor', RecordingProcessPoolExecutor)
+    for lazy in [False, True]:
+        mosaic2 = load_mosaic(fpath, workers=2, lazy=lazy)
+        assert all(t1 == t2 for t1, t2 in zip(mosaic.tiles, mosaic2.tiles))
+    assert len(executors) == 2
+
+
+def test_gridspec_lazy_load(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    fpath, _ = mosaic.to_netcdf(directory=tmp_path)
+    eager = load_mosaic(fpath)
+    lazy = load_mosaic(fpath, lazy=True)
+    assert str(lazy) == str(eager)
+    for t1, t2 in zip(eager.tiles, lazy.tiles):
+        assert isinstance(t2.supergrid_lats, LazyArray)
+        assert t2.get_corners() == t1.get_corners()
+        assert t2.is_curvilinear()
+        assert np.array_equal(t2.supergrid_lons[3:5, 1], t1.supergrid_lons[3:5, 1])
+        assert np.allclose(t2.area, t1.area)
+        assert t1 == t2
+
+
+def test_cli_dump(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    fpath, tile_paths = mosaic.to_netcdf(directory=tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(dump, [fpath])
+    assert result.exit_code == 0
+    assert result.output == str(load_mosaic(fpath)) + '\n'
+    result = runner.invoke(dump, [str(tile_paths[0])])
+    assert result.exit_code == 0
+    assert result.output == str(mosaic.tiles[0]) + '\n'
+
+
+def test_stored_area(tmp_path, monkeypatch):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    fpath, tile_paths = mosaic.to_netcdf(directory=tmp_path)
+    latlon_tile = GridspecRegularLatLon(8, 5)
+    latlon_path = latlon_tile.to_netcdf(tmp_path)
+
+    def calc_area(self):
+        raise AssertionError("area was recomputed")
+    with monkeypatch.context() as m:
+        m.setattr(LogicallyRectangularGrid, '_calc_area', calc_area)
+        for lazy in [False, True]:
+            tile = load_tile(tile_paths[0], lazy=lazy)
+            assert np.array_equal(tile.area, mosaic.tiles[0].area)
+        cf_tile = CFSingleTile()
+        assert cf_tile.load(xr.open_dataset(latlon_path))
+        assert np.array_equal(cf_tile.area, latlon_tile.area)
+
+    # the stored area does not match a modified grid
+    tile = load_tile(tile_paths[0])
+    tile.supergrid_lats = tile.supergrid_lats.copy()
+    tile.supergrid_lats[4, 4] += 1
+    assert not np.array_equal(tile.area, mosaic.tiles[0].area)
+
+
+def test_calc_area_block_size():
+    tile = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50).tiles[0]
+    area = tile._calc_area()
+    for block_size in [1, 7, 40]:
+        for workers in [1, 3]:
+            assert np.array_equal(tile._calc_area(block_size=block_size, workers=workers), area)
+
+
+def test_area_workers_env(monkeypatch):
+    monkeypatch.delenv('GRIDSPEC_AREA_WORKERS', raising=False)
+    assert gridspec.base._area_workers_from_env() == (os.cpu_count() or 1)
+    monkeypatch.setenv('GRIDSPEC_AREA_WORKERS', '3')
+    assert gridspec.base._area_workers_from_env() == 3
+    for value in ['four', '0']:
+        monkeypatch.setenv('GRIDSPEC_AREA_WORKERS', value)
+        with pytest.warns(UserWarning, match='GRIDSPEC_AREA_WORKERS'):
+            assert gridspec.base._area_workers_from_env() == (os.cpu_count() or 1)
+
+
+def test_latlon_area():
+    tile = GridspecRegularLatLon(144, 91, pole_centered=True)
+    area = tile.area
+    assert tile.supergrid_lats is None
+    assert area.shape == (91, 144)
+    assert np.isclose(area.sum(), 4 * np.pi * 6371000. ** 2, rtol=1e-12)
+    # away from the poles, the cells are close to quadrilaterals with great circle edges
+    tile._update_supergrids()
+    assert tile.supergrid_lats.shape == (183,)
+    quad_area = LogicallyRectangularGrid(*tile.supergrids_2d())._calc_area()
+    assert np.allclose(area[1:-1], quad_area[1:-1], rtol=1e-3)
+
+
+def test_latlon_supergrids():
+    tile = GridspecRegularLatLon(8, 5, dateline_centered=True)
+    tile._update_supergrids()
+    lats, lons = tile.supergrids_2d()
+    assert lats.shape == lons.shape == (11, 17)
+    assert np.array_equal(lats[1::2, 1::2], np.broadcast_to(tile.center_lats[:, None], (5, 8)))
+    assert np.array_equal(lons[0::2, 2], np.full(6, tile.lon_bnds[1, 0]))
+
+    tile2 = CFSingleTile()
+    tile2.init_from_supergrids(tile.supergrid_lats, tile.supergrid_lons)
+    for name in ['center_lats', 'center_lons', 'lat_bnds', 'lon_bnds']:
+        assert np.array_equal(getattr(tile2, name), getattr(tile, name))
+
+
+def test_cf_curvilinear_supergrids(tmp_path):
+    gridspec_tile = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50).tiles[2]
+    tile = CFSingleTile(name='c6_tile3')
+    tile.init_from_supergrids(gridspec_tile.supergrid_lats, gridspec_tile.supergrid_lons)
+    assert tile.lat_bnds.shape == (6, 6, 4)
+    assert np.array_equal(tile.lon_bnds[2, 3], gridspec_tile.supergrid_lons[[4, 4, 6, 6], [6, 8, 8, 6]])
+
+    tile._update_supergrids()
+    assert np.array_equal(tile.supergrid_lats[0::2, 0::2], gridspec_tile.supergrid_lats[0::2, 0::2])
+    assert np.array_equal(tile.supergrid_lons[1::2, 1::2], gridspec_tile.supergrid_lons[1::2, 1::2])
+    assert np.array_equal(tile.area, gridspec_tile.area)
+
+    # CF bounds have no edge midpoints, so they are interpolated (along great circles)
+    gridspec_tile = GridspecGnomonicCubedSphere(24).tiles[0]
+    tile3 = CFSingleTile()
+    tile3.init_from_supergrids(gridspec_tile.supergrid_lats, gridspec_tile.supergrid_lons)
+    tile3._update_supergrids()
+    assert np.allclose(tile3.supergrid_lats, gridspec_tile.supergrid_lats, rtol=0, atol=0.02)
+    assert np.allclose((tile3.supergrid_lons - gridspec_tile.supergrid_lons + 180) % 360, 180, rtol=0, atol=0.02)
+
+    tile2 = CFSingleTile()
+    assert tile2.load(xr.open_dataset(tile.to_netcdf(tmp_path)))
+    assert tile2.is_curvilinear()
+    assert np.array_equal(tile2.lat_bnds, tile.lat_bnds)
+
+    tile2.lat_bnds = tile2.lat_bnds.copy()
+    tile2.lat_bnds[2, 3, 2] += 0.1
+    with pytest.raises(ValueError):
+        tile2._update_supergrids()
+
+
+def test_split_datafile_blocks(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(24)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    original = xr.open_dataset(SAMPLE_C24_DATAFILE)
+    for max_block_bytes in [1000, 50000, None]:
+        directory = tmp_path.joinpath(f'split_{max_block_bytes}')
+        directory.mkdir()
+        kwargs = {} if max_block_bytes is None else dict(max_block_bytes=max_block_bytes)
+        split_files = split_datafile(SAMPLE_C24_DATAFILE, 'nf', gridspec_path, directory=directory, **kwargs)
+        for i, fpath in enumerate(split_files):
+            tile_ds = xr.open_dataset(fpath)
+            assert tile_ds.identical(original.isel(nf=i))
+
+
+def test_split_datafile_strings(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    datafile = tmp_path.joinpath('strings.nc')
+    with netCDF4.Dataset(datafile, 'w') as ds:
+        ds.createDimension('nf', 6)
+        ds.createDimension('Ydim', 6)
+        ds.createDimension('Xdim', 6)
+        ds.createVariable('label', str, ('nf',))[:] = np.array([f'face {i}' for i in range(6)], dtype=object)
+        ds.createVariable('source', str, ())[...] = np.array('model', dtype=object)
+        ds.createVariable('T', 'f4', ('nf', 'Ydim', 'Xdim'))[:] = np.arange(6 * 36).reshape(6, 6, 6)
+    split_files = split_datafile(datafile, 'nf', gridspec_path, directory=tmp_path, max_block_bytes=100)
+    for i, fpath in enumerate(split_files):
+        with netCDF4.Dataset(fpath) as ds:
+            assert ds['label'][...] == f'face {i}'
+            assert ds['source'][...] == 'model'
+            assert np.array_equal(ds['T'][:], np.arange(i * 36, (i + 1) * 36).reshape(6, 6))
+            assert 'coordinates' not in ds['T'].ncattrs()
+
+
+def test_copy_blocks():
+    shape = (3, 4, 5)
+    for max_bytes in [1, 8, 40, 100, 160, 480, 10**6]:
+        seen = np.zeros(shape, dtype=int)
+        for key in copy_blocks(shape, 8, max_bytes):
+            assert seen[key].size * 8 <= max(max_bytes, 8)
+            seen[key] += 1
+        assert np.all(seen == 1)
+
+
+def test_cli_split_batch(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(24)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    bad_file = tmp_path.joinpath('not_a_datafile.nc')
+    bad_file.write_text('not netcdf')
+    runner = CliRunner()
+    args = [str(SAMPLE_C24_DATAFILE), str(bad_file), '-m', gridspec_path, '-d', 'nf', '-o', str(tmp_path)]
+    for jobs in ['1', '2']:
+        result = runner.invoke(split, [*args, '-j', jobs])
+        assert result.exit_code != 0
+        assert 'Created 6 files' in result.output
+        assert 'MB/s' in result.output
+        assert 'Failed to process 1 of 2' in result.output
+        assert str(bad_file) in result.output.split('Failed to process')[1]
+
+
+def test_join_datafiles_streaming(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(24)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    split_files = split_datafile(SAMPLE_C24_DATAFILE, tile_dim='nf', gridspec_file=gridspec_path, directory=tmp_path)
+
+    rename_dict = dict(Xdim='x', SpeciesConc_O3='O3')
+    coord_attrs_dict = dict(x=dict(long_name='x index'))
+    transpose = ('nf', 'lev', 'time', 'Ydim', 'x')
+    expected = xr.concat([xr.open_dataset(f) for f in split_files], dim='nf', coords='different')
+    expected = expected.rename(rename_dict)
+    expected.coords['x'].attrs.update(coord_attrs_dict['x'])
+    expected = expected.transpose(*transpose).drop_vars('cubed_sphere')
+
+    for max_block_bytes in [1000, 100000]:
+        joined_file = join_datafiles(
+            'GCHP.SpeciesConc.20180101_1200z', gridspec_path, tile_dim='nf', directory=tmp_path,
+            rename_dict=rename_dict, coord_attrs_dict=coord_attrs_dict, transpose=transpose,
+            max_block_bytes=max_block_bytes
+        )
+        joined = xr.open_dataset(joined_file).drop_vars('cubed_sphere')
+        assert joined.identical(expected)
+        assert joined.O3.dims == ('nf', 'lev', 'time', 'Ydim', 'x')
+
+
+def test_join_datafiles_strings(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    for i, tile_name in enumerate(mosaic.tile_names):
+        with netCDF4.Dataset(tmp_path.joinpath(f'strings.{tile_name}.nc'), 'w') as ds:
+            ds.createDimension('Ydim', 6)
+            ds.createDimension('Xdim', 6)
+            ds.createVariable('label', str, ())[...] = np.array(f'face {i}', dtype=object)
+            ds.createVariable('T', 'f4', ('Ydim', 'Xdim'))[:] = np.full((6, 6), i)
+    joined_file = join_datafiles('strings', gridspec_path, tile_dim='nf', directory=tmp_path, max_block_bytes=100)
+    with netCDF4.Dataset(joined_file) as ds:
+        assert ds['label'].dimensions == ('nf',)
+        assert list(ds['label'][:]) == [f'face {i}' for i in range(6)]
+        assert np.array_equal(ds['T'][:, 0, 0], np.arange(6))
+
+
+def test_cli_touch_loads_tile_centers_once(tmp_path, monkeypatch):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    calls = []
+
+    def counting_load_tile_centers(gridspec_file):
+        calls.append(gridspec_file)
+        return load_tile_centers(gridspec_file)
+
+    monkeypatch.setattr(gridspec.cli, 'load_tile_centers', counting_load_tile_centers)
+    gridspec.cli.cached_tile_centers.cache_clear()
+    result = CliRunner().invoke(touch, ['a', 'b', 'c', '-m', gridspec_path, '-o', str(tmp_path), '-j', '1'])
+    gridspec.cli.cached_tile_centers.cache_clear()
+    assert result.exit_code == 0 and 'Created 18 files' in result.output
+    assert calls == [gridspec_path]
+
+
+def test_cli_touch_and_join_batch(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(24)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    runner = CliRunner()
+    result = runner.invoke(touch, ['a', 'b', 'c', '-m', gridspec_path, '-o', str(tmp_path), '-j', '2'])
+    assert result.exit_code == 0
+    assert 'Created 18 files' in result.output
+    ds = xr.open_dataset(tmp_path.joinpath('b.tile3.nc'))
+    assert np.array_equal(ds.lats, mosaic.tiles[2].supergrid_lats[1::2, 1::2])
+
+    split_datafile(SAMPLE_C24_DATAFILE, tile_dim='nf', gridspec_file=gridspec_path, directory=tmp_path)
+    spec = tmp_path.joinpath('spec.json')
+    spec.write_text('{"transpose": ["time", "lev", "nf", "Ydim", "Xdim"]}')
+    args = ['GCHP.SpeciesConc.20180101_1200z', 'missing', '-m', gridspec_path, '-d', 'nf', '-s', str(spec),
+            '-o', str(tmp_path), '-j', '2']
+    result = runner.invoke(join, args)
+    assert result.exit_code != 0
+    assert 'Created 1 files' in result.output and 'MB/s' in result.output
+    assert 'Failed to process 1 of 2' in result.output
+
+
+def test_chunk_shape():
+    assert chunk_shape((49, 49), 8) == (49, 49)
+    assert chunk_shape((2, 72, 6, 1441, 1441), 4, max_bytes=1441 * 4 * 100) == (1, 1, 1, 100, 1441)
+    assert chunk_shape((0, 10), 8) == (1, 10)
+    assert chunk_shape((1000,), 8, max_bytes=800) == (100,)
+
+
+def test_encoding_policy_grids(tmp_path):
+    encoding = EncodingPolicy(complevel=4, chunk_bytes=20 * 49 * 8, float32_area=True)
+    for streaming in [False, True]:
+        directory = tmp_path.joinpath(f'streaming_{streaming}')
+        directory.mkdir()
+        mosaic = GridspecGnomonicCubedSphere(24, streaming=streaming)
+        block_rows = 5 if streaming else None
+        fpath, tile_paths = mosaic.to_netcdf(directory=directory, block_rows=block_rows, encoding=encoding)
+        with netCDF4.Dataset(tile_paths[0]) as nc:
+            assert nc['lats'].filters()['zlib'] and nc['lats'].filters()['complevel'] == 4
+            assert nc['lats'].chunking() == [20, 49]
+            assert nc['lats'].dtype == np.float64
+            assert nc['area'].dtype == np.float32
+        mosaic2 = load_mosaic(fpath)
+        tile = mosaic2.tiles[0]
+        assert tile == GridspecGnomonicCubedSphere(24).tiles[0]
+        stored_area = tile.area
+        assert stored_area.dtype == np.float64
+        assert np.allclose(stored_area, tile._calc_area(), rtol=1e-6)
+
+    latlon_tile = GridspecRegularLatLon(nx=36, ny=18)
+    ds = xr.open_dataset(latlon_tile.to_netcdf(tmp_path, encoding=encoding))
+    assert ds.area.encoding['dtype'] == np.float32 and ds.area.encoding['zlib']
+
+
+def test_encoding_policy_datafiles(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(24)
+    gridspec_path, _ = mosaic.to_netcdf(directory=tmp_path)
+    encoding = EncodingPolicy(complevel=1, shuffle=False, significant_digits=3)
+    split_files = split_datafile(SAMPLE_C24_DATAFILE, 'nf', gridspec_path, directory=tmp_path, encoding=encoding)
+    with netCDF4.Dataset(split_files[0]) as nc:
+        assert nc['SpeciesConc_O3'].filters()['complevel'] == 1 and not nc['SpeciesConc_O3'].filters()['shuffle']
+        assert nc['SpeciesConc_O3'].chunking() == [1, 1, 24, 24]
+        assert nc['SpeciesConc_O3'].quantization() is not None
+        assert nc['lats'].quantization() is None
+
+    original = xr.open_dataset(SAMPLE_C24_DATAFILE)
+    tile_ds = xr.open_dataset(split_files[2])
+    assert tile_ds.lats.identical(original.lats.isel(nf=2))
+    assert np.allclose(tile_ds.SpeciesConc_O3, original.SpeciesConc_O3.isel(nf=2), rtol=1e-3, atol=0)
+
+    joined_file = join_datafiles(
+        'GCHP.SpeciesConc.20180101_1200z', gridspec_path, tile_dim='nf', directory=tmp_path,
+        transpose=('time', 'lev', 'nf', 'Ydim', 'Xdim'), encoding=EncodingPolicy(complevel=5)
+    )
+    with netCDF4.Dataset(joined_file) as nc:
+        assert nc['SpeciesConc_O3'].filters()['complevel'] == 5
+        assert nc['SpeciesConc_O3'].chunking() == [1, 1, 1, 24, 24]
+
+    touched = touch_datafiles(gridspec_path, 'touched', directory=tmp_path, encoding=EncodingPolicy(complevel=2))
+    with netCDF4.Dataset(touched[0]) as nc:
+        assert nc['lats'].filters()['complevel'] == 2
+
+
+def test_cli_encoding_options(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(gcs, ['12', '-o', str(tmp_path), '-z', '6', '--float32-area'])
+    assert result.exit_code == 0
+    ds = xr.open_dataset(tmp_path.joinpath('c12.tile1.nc'))
+    assert ds.area.encoding['complevel'] == 6 and ds.area.encoding['dtype'] == np.float32
+
+
+def test_zarr_mosaic(tmp_path):
+    pytest.importorskip('zarr')
+    mosaic = GridspecGnomonicCubedSphere(12, stretch_factor=2, target_lat=30, target_lon=50)
+    streamed = GridspecGnomonicCubedSphere(12, stretch_factor=2, target_lat=30, target_lon=50, streaming=True)
+    encoding = EncodingPolicy(complevel=3, float32_area=True)
+    stores = [
+        mosaic.to_zarr(tmp_path.joinpath('threads.zarr'), workers=2),
+        mosaic.to_zarr(tmp_path.joinpath('processes.zarr'), workers=2, processes=True, encoding=encoding),
+        streamed.to_zarr(tmp_path.joinpath('streamed.zarr'), block_rows=5, workers=2, encoding=encoding),
+    ]
+    for store in stores:
+        mosaic2 = load_mosaic(store, workers=2)
+        assert mosaic2 == mosaic
+        for t1, t2 in zip(mosaic.tiles, mosaic2.tiles):
+            assert t1 == t2
+            assert t2._stored_area.attrs['grid_checksum'] == t2.grid_checksum()
+            assert np.allclose(t2.area, t1.area, rtol=1e-6)
+    ds = open_zarr_dataset(stores[2], group='tile2')
+    assert ds.lats.encoding['chunks'] == (10, 25) and ds.area.encoding['chunks'] == (5, 12)
+    assert ds.area.dtype == np.float32
+
+    tile = load_tile(stores[0], lazy=True, group='tile3')
+    assert isinstance(tile.supergrid_lats, LazyArray)
+    assert tile == mosaic.tiles[2]
+
+
+def test_zarr_cli(tmp_path):
+    pytest.importorskip('zarr')
+    runner = CliRunner()
+    result = runner.invoke(gcs, ['6', '-o', str(tmp_path), '--zarr', '-j', '2'])
+    assert result.exit_code == 0
+    result = runner.invoke(dump, [str(tmp_path.joinpath('c6_gridspec.zarr'))])
+    assert result.exit_code == 0
+    assert 'tile6' in result.output
+
+    result = runner.invoke(latlon, ['18', '36', '-o', str(tmp_path), '--zarr'])
+    assert result.exit_code == 0
+    cf_tile = CFSingleTile()
+    assert cf_tile.open_zarr(tmp_path.joinpath('regular_lat_lon_18x36.zarr'))
+    assert np.allclose(cf_tile.area, GridspecRegularLatLon(nx=36, ny=18).area)
+
+
+def test_consolidated_mosaic(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(12, stretch_factor=2, target_lat=30, target_lon=50)
+    streamed = GridspecGnomonicCubedSphere(12, stretch_factor=2, target_lat=30, target_lon=50, streaming=True)
+    fpath = mosaic.to_netcdf_consolidated(tmp_path)
+    streamed_path = streamed.to_netcdf_consolidated(tmp_path, filename='streamed.nc')
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f'{mosaic.name}.nc', 'streamed.nc']
+    ds = xr.open_dataset(fpath)
+    assert ds.lats.dims == ('ntiles', 'yc', 'xc') and ds.area.dims == ('ntiles', 'y', 'x')
+    assert ds.tile4.attrs['standard_name'] == 'grid_tile_spec'
+
+    for path in [fpath, streamed_path]:
+        for lazy in [False, True]:
+            mosaic2 = load_mosaic(path, lazy=lazy)
+            assert mosaic2.consolidated
+            assert mosaic2 == mosaic
+            for t1, t2 in zip(mosaic.tiles, mosaic2.tiles):
+                assert t1 == t2
+                assert t1.attrs == t2.attrs
+                assert isinstance(t2.supergrid_lats, LazyArray) == lazy
+                assert t2._stored_area.attrs['grid_checksum'] == t2.grid_checksum()
+                assert np.allclose(t2.area, t1.area)
+    with pytest.raises(RuntimeError):
+        load_tile(fpath)
+
+
+def test_convert_mosaic(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6)
+    for name in ['split', 'consolidated', 'split_again']:
+        tmp_path.joinpath(name).mkdir()
+    split_path, _ = mosaic.to_netcdf(tmp_path.joinpath('split'))
+    consolidated_path = consolidate_mosaic(split_path, tmp_path.joinpath('consolidated'))
+    with pytest.raises(ValueError):
+        split_mosaic(consolidated_path, tmp_path.joinpath('consolidated'))
+    split_path2, tile_paths = split_mosaic(consolidated_path, tmp_path.joinpath('split_again'))
+    for name in [Path(split_path).name, *[Path(p).name for p in tile_paths]]:
+        expected = xr.open_dataset(tmp_path.joinpath('split', name))
+        actual = xr.open_dataset(tmp_path.joinpath('split_again', name))
+        assert actual.identical(expected)
+
+    runner = CliRunner()
+    result = runner.invoke(convert, [consolidated_path, '-o', str(tmp_path.joinpath('consolidated'))])
+    assert result.exit_code != 0 and 'overwrite' in result.output
+    result = runner.invoke(gcs, ['6', '-o', str(tmp_path), '--consolidated', '-z', '1'])
+    assert result.exit_code == 0
+    result = runner.invoke(dump, [str(tmp_path.joinpath(f'{mosaic.name}.nc'))])
+    assert result.exit_code == 0
+    assert 'consolidated' in result.output and 'tile6' in result.output
+    for args in [['--streaming'], ['--block-rows', '2'], ['-j', '2']]:
+        result = runner.invoke(gcs, ['6', '-o', str(tmp_path), '--consolidated', *args])
+        assert result.exit_code != 0 and '--consolidated is not valid' in result.output
+    result = runner.invoke(sgcs, ['6', '-s', '2', '-t', '30', '50', '-o', str(tmp_path), '--consolidated', '--streaming'])
+    assert result.exit_code != 0 and '--consolidated is not valid' in result.output
+
+
+def test_streaming_tiles_on_demand(tmp_path):
+    mosaic = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50)
+    streamed = GridspecGnomonicCubedSphere(6, stretch_factor=2, target_lat=30, target_lon=50, streaming=True)
+    for t1, t2 in zip(mosaic.tiles, streamed.tiles):
+        assert t2._supergrid_lats is None
+        assert str(t2) == str(t1)
+        assert t2 == t1
+        assert np.allclose(t2.area, t1.area)
+    assert 'tile6' in str(streamed)
+    with pytest.raises(ValueError):
+        mosaic.to_netcdf(tmp_path, block_rows=2)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from gridspec.gnom_cube_sphere.schmidt import scs_transform, scs_transform_inplace, rotate_vectors, \
+    schmidt_transform, spherical_to_cartesian, cartesian_to_spherical
+
+
+def reference_scs_transform(x, y, s, tx, ty):
+    x, y = schmidt_transform(np.deg2rad(x), np.deg2rad(y), s)
+    x, y, z = spherical_to_cartesian(x, y)
+    x, y, z = rotate_vectors(x, y, z, np.array([0, 1, 0]), np.deg2rad(ty) + np.pi / 2)
+    x, y, z = rotate_vectors(x, y, z, np.array([0, 0, 1]), np.deg2rad(tx) - np.pi)
+    x, y = cartesian_to_spherical(x, y, z)
+    return np.rad2deg(x), np.rad2deg(y)
+
+
+def test_scs_transform_matches_reference():
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(0, 360, 1000)
+    lat = rng.uniform(-89, 89, 1000)
+    expected_lon, expected_lat = reference_scs_transform(lon, lat, 2.5, 46, 25)
+    new_lon, new_lat = scs_transform(lon, lat, 2.5, 46, 25)
+    assert np.allclose(new_lon, expected_lon, atol=1e-9)
+    assert np.allclose(new_lat, expected_lat, atol=1e-9)
+
+
+def test_scs_transform_inplace_batched():
+    rng = np.random.default_rng(1)
+    lon = rng.uniform(0, 360, (6, 9, 9))
+    lat = rng.uniform(-89, 89, (6, 9, 9))
+    expected_lon, expected_lat = scs_transform(lon.ravel(), lat.ravel(), 3, -100, 40)
+
+    # non-contiguous views are transformed in place too
+    lon_t = lon.transpose(1, 2, 0).copy().transpose(2, 0, 1)
+    lat_t = lat.transpose(1, 2, 0).copy().transpose(2, 0, 1)
+    scs_transform_inplace(lon_t, lat_t, 3, -100, 40, buffersize=50)
+    assert np.allclose(lon_t.ravel(), expected_lon)
+    assert np.allclose(lat_t.ravel(), expected_lat)